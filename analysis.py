@@ -7,7 +7,20 @@ app = marimo.App()
 @app.cell(hide_code=True)
 def _():
     import marimo as mo
-    return (mo,)
+
+    def show_chart(build):
+        # Charts are only built (and altair imported) when marimo can display
+        # them; `uv run analysis.py` runs in script mode and skips them. The
+        # scatter charts pass their data through chartdata.downsample(), which
+        # bounds what they embed (see chartdata.py)
+        import profiling
+
+        if mo.app_meta().mode in ("edit", "run"):
+            # marimo renames a cell's _chartN to cell_<id>_chartN
+            with profiling.span(build.__name__.rsplit("_", 1)[-1], "chart"):
+                return build()
+        return None
+    return mo, show_chart
 
 
 @app.cell(hide_code=True)
@@ -75,24 +88,36 @@ def _(mo):
 
 @app.cell
 def _():
-    import json
     import os
+    import sys
 
-    import altair as alt
     import pandas as pd
 
-    dataset_path = "datasets"
-    files = [f for f in os.listdir(dataset_path) if f.endswith("_full.json")]
+    import chartdata
+    import metrics
+    import profiling
+    import report
+    from loader import LazyDatasets, LazyProjectTable
 
-    dfs = {}
-    for file in files:
-        key = file.replace("_full.json", "")
-        with open(os.path.join(dataset_path, file), "r") as f:
-            data = json.load(f)
-            # The data is a list of dictionaries
-            dfs[key] = pd.DataFrame(data)
-            print(f"Loaded {key} with {len(dfs[key])} records")
-    return alt, dfs, json, os, pd
+    dataset_path = "datasets"
+    # Each leaderboard is read (from its columnar copy when it is up to date,
+    # otherwise the raw JSON) the first time a cell looks it up
+    dfs = LazyDatasets(dataset_path)
+
+    # Project 360: the project leaderboards indexed once by slug. The sections
+    # and the report read each metric from it through the memoized
+    # functions in metrics.py, so every metric is computed once per run
+    projects = LazyProjectTable(dfs)
+
+    # `uv run analysis.py --no-cache` recomputes every metric instead of reading
+    # the tables cached in .cache/metrics/
+    if "--no-cache" in sys.argv:
+        metrics.cache_enabled = False
+    # `uv run analysis.py --trace` (or LFX_TRACE=1) records where the time and
+    # memory go; the trace is written with the report below
+    if "--trace" in sys.argv:
+        profiling.enable()
+    return chartdata, dfs, metrics, os, pd, profiling, projects, report
 
 
 @app.cell(hide_code=True)
@@ -114,19 +139,10 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
-    # Merge active-contributors and commit-activity on project name/slug
+def _(chartdata, dfs, metrics, projects, show_chart):
+    # Join active-contributors and commit-activity on project slug
     if "active-contributors" in dfs and "commit-activity" in dfs:
-        _ac_df = dfs["active-contributors"][["name", "slug", "value"]].rename(
-            columns={"value": "active_contributors"}
-        )
-        _ca_df = dfs["commit-activity"][["slug", "value"]].rename(
-            columns={"value": "commits"}
-        )
-        merged_df = pd.merge(_ac_df, _ca_df, on="slug", how="inner")
-        merged_df["commits_per_contributor"] = (
-            merged_df["commits"] / merged_df["active_contributors"]
-        )
+        merged_df = metrics.efficiency(projects)
         top_efficient = merged_df.sort_values(
             "commits_per_contributor", ascending=False
         ).head(10)
@@ -143,29 +159,52 @@ def _(alt, dfs, pd):
             ]
         )
 
-        chart1 = (
-            alt.Chart(merged_df)
-            .mark_circle()
-            .encode(
-                x=alt.X(
-                    "active_contributors",
-                    scale=alt.Scale(type="log"),
-                    title="Active Contributors",
-                ),
-                y=alt.Y("commits", scale=alt.Scale(type="log"), title="Commits"),
-                size=alt.Size(
-                    "commits_per_contributor", title="Commits per Contributor"
-                ),
-                tooltip=[
-                    "name",
-                    "active_contributors",
-                    "commits",
-                    "commits_per_contributor",
-                ],
+        def _chart1():
+            import altair as alt
+
+            points, density = chartdata.downsample(
+                merged_df,
+                "active_contributors",
+                "commits",
+                log_x=True,
+                log_y=True,
+                top={"commits_per_contributor": 50},
+            )
+            chart = (
+                alt.Chart(points)
+                .mark_circle()
+                .encode(
+                    x=alt.X(
+                        "active_contributors",
+                        scale=alt.Scale(type="log"),
+                        title="Active Contributors",
+                    ),
+                    y=alt.Y("commits", scale=alt.Scale(type="log"), title="Commits"),
+                    size=alt.Size(
+                        "commits_per_contributor", title="Commits per Contributor"
+                    ),
+                    tooltip=[
+                        "name",
+                        "active_contributors",
+                        "commits",
+                        "commits_per_contributor",
+                    ],
+                )
+                .properties(title="Active Contributors vs. Commit Activity")
+                .interactive()
+            )
+            return chartdata.with_density(
+                chart,
+                density,
+                "active_contributors",
+                "commits",
+                log_x=True,
+                log_y=True,
+                x_title="Active Contributors",
+                y_title="Commits",
             )
-            .properties(title="Active Contributors vs. Commit Activity")
-            .interactive()
-        )
+
+        chart1 = show_chart(_chart1)
 
     else:
         print("Required datasets not found.")
@@ -189,45 +228,69 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(chartdata, dfs, metrics, projects, show_chart):
     if "fastest-responders" in dfs and "resolution-rate" in dfs:
-        fr_df = dfs["fastest-responders"][["name", "slug", "value"]].rename(
-            columns={"value": "response_time_hours"}
-        )  # Assuming hours or similar unit
-
-        rr_df = dfs["resolution-rate"][["slug", "value"]].rename(
-            columns={"value": "resolution_rate"}
-        )
-
-        merged_rr_fr = pd.merge(fr_df, rr_df, on="slug", how="inner")
-
-        correlation = merged_rr_fr["response_time_hours"].corr(
-            merged_rr_fr["resolution_rate"]
-        )
+        merged_rr_fr = metrics.triage(projects)
+        correlation = metrics.triage_correlation(projects)
         print(
             f"Correlation between Response Time and Resolution Rate: {correlation:.2f}"
         )
 
-        base = alt.Chart(merged_rr_fr).encode(
-            x=alt.X("response_time_hours", title="Response Time (Hours)"),
-            y=alt.Y("resolution_rate", title="Resolution Rate"),
-        )
+        def _chart2():
+            import altair as alt
 
-        points = base.mark_circle().encode(
-            tooltip=["name", "response_time_hours", "resolution_rate"]
-        )
+            sample, density = chartdata.downsample(
+                merged_rr_fr,
+                "response_time_hours",
+                "resolution_rate",
+                top={"resolution_rate": 50},
+                bottom={"response_time_hours": 50},
+            )
+            base = alt.Chart(sample).encode(
+                x=alt.X("response_time_hours", title="Response Time (Hours)"),
+                y=alt.Y("resolution_rate", title="Resolution Rate"),
+            )
+
+            points = base.mark_circle().encode(
+                tooltip=["name", "response_time_hours", "resolution_rate"]
+            )
 
-        line = base.transform_regression(
-            "response_time_hours", "resolution_rate"
-        ).mark_line(color="red")
+            # Fitted on every project once the points are downsampled
+            if density.empty:
+                line = base.transform_regression(
+                    "response_time_hours", "resolution_rate"
+                ).mark_line(color="red")
+            else:
+                line = (
+                    alt.Chart(
+                        chartdata.regression_line(
+                            merged_rr_fr, "response_time_hours", "resolution_rate"
+                        )
+                    )
+                    .mark_line(color="red")
+                    .encode(
+                        x=alt.X("response_time_hours", title="Response Time (Hours)"),
+                        y=alt.Y("resolution_rate", title="Resolution Rate"),
+                    )
+                )
 
-        chart2 = (
-            (points + line)
-            .properties(
-                title=f"Response Time vs. Resolution Rate (Correlation: {correlation:.2f})"
+            chart = (
+                (points + line)
+                .properties(
+                    title=f"Response Time vs. Resolution Rate (Correlation: {correlation:.2f})"
+                )
+                .interactive()
+            )
+            return chartdata.with_density(
+                chart,
+                density,
+                "response_time_hours",
+                "resolution_rate",
+                x_title="Response Time (Hours)",
+                y_title="Resolution Rate",
             )
-            .interactive()
-        )
+
+        chart2 = show_chart(_chart2)
 
     else:
         print("Required datasets not found.")
@@ -253,35 +316,49 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(chartdata, dfs, metrics, projects, show_chart):
     if "codebase-size" in dfs and "commit-activity" in dfs:
-        cs_df = dfs["codebase-size"][["name", "slug", "value"]].rename(
-            columns={"value": "codebase_size"}
-        )
-        _ca_df = dfs["commit-activity"][["slug", "value"]].rename(
-            columns={"value": "commits"}
-        )
-        merged_cs_ca = pd.merge(cs_df, _ca_df, on="slug", how="inner")
-
-        chart3 = (
-            alt.Chart(merged_cs_ca)
-            .mark_circle()
-            .encode(
-                x=alt.X("commits", scale=alt.Scale(type="log"), title="Commits"),
-                y=alt.Y(
-                    "codebase_size",
-                    scale=alt.Scale(type="log"),
-                    title="Codebase Size (LOC)",
-                ),
-                tooltip=["name", "commits", "codebase_size"],
+        merged_cs_ca = metrics.growth(projects)
+
+        def _chart3():
+            import altair as alt
+
+            points, density = chartdata.downsample(
+                merged_cs_ca,
+                "commits",
+                "codebase_size",
+                log_x=True,
+                log_y=True,
+                top={"maintenance_ratio": 50},
+            )
+            chart = (
+                alt.Chart(points)
+                .mark_circle()
+                .encode(
+                    x=alt.X("commits", scale=alt.Scale(type="log"), title="Commits"),
+                    y=alt.Y(
+                        "codebase_size",
+                        scale=alt.Scale(type="log"),
+                        title="Codebase Size (LOC)",
+                    ),
+                    tooltip=["name", "commits", "codebase_size"],
+                )
+                .properties(title="Commit Activity vs. Codebase Size")
+                .interactive()
+            )
+            return chartdata.with_density(
+                chart,
+                density,
+                "commits",
+                "codebase_size",
+                log_x=True,
+                log_y=True,
+                x_title="Commits",
+                y_title="Codebase Size (LOC)",
             )
-            .properties(title="Commit Activity vs. Codebase Size")
-            .interactive()
-        )
 
-        merged_cs_ca["maintenance_ratio"] = (
-            merged_cs_ca["commits"] / merged_cs_ca["codebase_size"]
-        )
+        chart3 = show_chart(_chart3)
+
         top_maintenance = merged_cs_ca.sort_values(
             "maintenance_ratio", ascending=False
         ).head(10)
@@ -317,22 +394,9 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(chartdata, dfs, metrics, projects, show_chart):
     if "active-organizations" in dfs and "active-contributors" in dfs:
-        ao_df = dfs["active-organizations"][["name", "slug", "value"]].rename(
-            columns={"value": "active_organizations"}
-        )
-        _ac_df = dfs["active-contributors"][["slug", "value"]].rename(
-            columns={"value": "active_contributors"}
-        )
-        merged_org_cont = pd.merge(ao_df, _ac_df, on="slug", how="inner")
-        merged_org_cont["org_diversity_ratio"] = (
-            merged_org_cont["active_organizations"]
-            / merged_org_cont["active_contributors"]
-        )
-        filtered_org_cont = merged_org_cont[
-            merged_org_cont["active_contributors"] > 50
-        ]
+        filtered_org_cont = metrics.hidden_gems(projects)
         top_diversity = filtered_org_cont.sort_values(
             "org_diversity_ratio", ascending=False
         ).head(10)
@@ -350,31 +414,54 @@ def _(alt, dfs, pd):
             ]
         )  # Filter for projects with at least a decent number of contributors to avoid noise
 
-        chart4 = (
-            alt.Chart(filtered_org_cont)
-            .mark_circle()
-            .encode(
-                x=alt.X(
-                    "active_contributors",
-                    scale=alt.Scale(type="log"),
-                    title="Active Contributors",
-                ),
-                y=alt.Y(
-                    "active_organizations",
-                    scale=alt.Scale(type="log"),
-                    title="Active Organizations",
-                ),
-                size=alt.Size("org_diversity_ratio", title="Diversity Ratio"),
-                tooltip=[
-                    "name",
-                    "active_contributors",
-                    "active_organizations",
-                    "org_diversity_ratio",
-                ],
+        def _chart4():
+            import altair as alt
+
+            points, density = chartdata.downsample(
+                filtered_org_cont,
+                "active_contributors",
+                "active_organizations",
+                log_x=True,
+                log_y=True,
+                top={"org_diversity_ratio": 50},
+            )
+            chart = (
+                alt.Chart(points)
+                .mark_circle()
+                .encode(
+                    x=alt.X(
+                        "active_contributors",
+                        scale=alt.Scale(type="log"),
+                        title="Active Contributors",
+                    ),
+                    y=alt.Y(
+                        "active_organizations",
+                        scale=alt.Scale(type="log"),
+                        title="Active Organizations",
+                    ),
+                    size=alt.Size("org_diversity_ratio", title="Diversity Ratio"),
+                    tooltip=[
+                        "name",
+                        "active_contributors",
+                        "active_organizations",
+                        "org_diversity_ratio",
+                    ],
+                )
+                .properties(title="Active Contributors vs. Active Organizations")
+                .interactive()
             )
-            .properties(title="Active Contributors vs. Active Organizations")
-            .interactive()
-        )
+            return chartdata.with_density(
+                chart,
+                density,
+                "active_contributors",
+                "active_organizations",
+                log_x=True,
+                log_y=True,
+                x_title="Active Contributors",
+                y_title="Active Organizations",
+            )
+
+        chart4 = show_chart(_chart4)
 
     else:
         print("Required datasets not found.")
@@ -400,11 +487,9 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs):
+def _(dfs, metrics, show_chart):
     if "small-teams-massive-output" in dfs:
-        st_df = dfs["small-teams-massive-output"][
-            ["name", "slug", "value", "collectionsSlugs"]
-        ].rename(columns={"value": "commits"})
+        st_df = metrics.bus_factor(dfs)
 
         # We don't have exact contributor counts for all of these in this dataset,
         # but we know they are <= 50.
@@ -415,20 +500,26 @@ def _(alt, dfs):
         print("Top 15 Small Teams (<=50 Contributors) with Massive Output:")
         print(top_small_teams[["name", "commits"]])
 
-        chart5 = (
-            alt.Chart(top_small_teams)
-            .mark_bar()
-            .encode(
-                x=alt.X("commits", title="Commit Volume (Last 12 Months)"),
-                y=alt.Y("name", sort="-x", title="Project Name"),
-                tooltip=["name", "commits"],
-                color=alt.Color("commits", scale=alt.Scale(scheme="viridis")),
-            )
-            .properties(
-                title="Small Teams, Massive Output: The 'Bus Factor' Watchlist"
+        def _chart5():
+            import altair as alt
+
+            chart = (
+                alt.Chart(top_small_teams)
+                .mark_bar()
+                .encode(
+                    x=alt.X("commits", title="Commit Volume (Last 12 Months)"),
+                    y=alt.Y("name", sort="-x", title="Project Name"),
+                    tooltip=["name", "commits"],
+                    color=alt.Color("commits", scale=alt.Scale(scheme="viridis")),
+                )
+                .properties(
+                    title="Small Teams, Massive Output: The 'Bus Factor' Watchlist"
+                )
+                .interactive()
             )
-            .interactive()
-        )
+            return chart
+
+        chart5 = show_chart(_chart5)
 
     else:
         print("Required datasets not found.")
@@ -452,38 +543,16 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(chartdata, dfs, metrics, pd, projects, show_chart):
     if "focused-teams" in dfs and "commit-activity" in dfs:
-        _ft_df_burnout = dfs["focused-teams"][["name", "slug", "value"]].rename(
-            columns={"value": "productivity_score"}
-        )
-        _ca_df_burnout = dfs["commit-activity"][
-            ["slug", "value", "previousPeriodValue"]
-        ].rename(
-            columns={"value": "commits", "previousPeriodValue": "prev_commits"}
-        )
-
-        _merged_burnout = pd.merge(
-            _ft_df_burnout, _ca_df_burnout, on="slug", how="inner"
-        )
-
-        # Calculate Momentum (Percentage Change)
-        # Handle division by zero
-        _merged_burnout["momentum"] = _merged_burnout.apply(
-            lambda row: (
-                (row["commits"] - row["prev_commits"]) / row["prev_commits"]
-                if row["prev_commits"] > 0
-                else 0
-            ),
-            axis=1,
-        )
+        # Momentum is the relative change in commits since the previous period
+        _merged_burnout = metrics.burnout(projects)
 
         # Filter for projects with negative momentum (slowing down)
         # We focus on projects that have at least some significant activity to avoid noise
-        _declining_projects = _merged_burnout[
-            (_merged_burnout["momentum"] < -0.1)
-            & (_merged_burnout["commits"] > 100)
-        ].sort_values("momentum", ascending=True)
+        _declining_projects = metrics.declining_projects(projects).sort_values(
+            "momentum", ascending=True
+        )
 
         print(
             "Top 10 'Focused Team' Projects with Dropping Momentum (Burnout Risk?):"
@@ -500,40 +569,61 @@ def _(alt, dfs, pd):
             ].head(10)
         )
 
-        chart6 = (
-            alt.Chart(_merged_burnout)
-            .mark_circle()
-            .encode(
-                x=alt.X(
-                    "productivity_score",
-                    scale=alt.Scale(type="log"),
-                    title="Productivity Score (Commits/Contributor)",
-                ),
-                y=alt.Y("momentum", title="Momentum (Activity Change)"),
-                color=alt.condition(
-                    alt.datum.momentum < 0,
-                    alt.value("red"),  # Red for negative momentum
-                    alt.value("green"),  # Green for positive
-                ),
-                tooltip=[
-                    "name",
-                    "productivity_score",
-                    "commits",
-                    "prev_commits",
-                    alt.Tooltip("momentum", format=".1%"),
-                ],
+        def _chart6():
+            import altair as alt
+
+            points, density = chartdata.downsample(
+                _merged_burnout,
+                "productivity_score",
+                "momentum",
+                log_x=True,
+                bottom={"momentum": 50},
+            )
+            chart = (
+                alt.Chart(points)
+                .mark_circle()
+                .encode(
+                    x=alt.X(
+                        "productivity_score",
+                        scale=alt.Scale(type="log"),
+                        title="Productivity Score (Commits/Contributor)",
+                    ),
+                    y=alt.Y("momentum", title="Momentum (Activity Change)"),
+                    color=alt.condition(
+                        alt.datum.momentum < 0,
+                        alt.value("red"),  # Red for negative momentum
+                        alt.value("green"),  # Green for positive
+                    ),
+                    tooltip=[
+                        "name",
+                        "productivity_score",
+                        "commits",
+                        "prev_commits",
+                        alt.Tooltip("momentum", format=".1%"),
+                    ],
+                )
+                .properties(title="Project Momentum vs. Productivity Score")
+                .interactive()
             )
-            .properties(title="Project Momentum vs. Productivity Score")
-            .interactive()
-        )
 
-        # Add a horizontal line at 0 momentum
-        rule = (
-            alt.Chart(pd.DataFrame({"y": [0]}))
-            .mark_rule(color="black")
-            .encode(y="y")
-        )
-        chart6 = chart6 + rule
+            # Add a horizontal line at 0 momentum
+            rule = (
+                alt.Chart(pd.DataFrame({"y": [0]}))
+                .mark_rule(color="black")
+                .encode(y="y")
+            )
+            chart = chart + rule
+            return chartdata.with_density(
+                chart,
+                density,
+                "productivity_score",
+                "momentum",
+                log_x=True,
+                x_title="Productivity Score (Commits/Contributor)",
+                y_title="Momentum (Activity Change)",
+            )
+
+        chart6 = show_chart(_chart6)
 
     else:
         print("Required datasets not found.")
@@ -559,77 +649,11 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(dfs, metrics, projects, show_chart):
     if "active-organizations" in dfs and "active-contributors" in dfs:
-        _ao_df_seg = dfs["active-organizations"][
-            ["name", "slug", "value", "collectionsSlugs"]
-        ].rename(columns={"value": "active_organizations"})
-        _ac_df_seg = dfs["active-contributors"][["slug", "value"]].rename(
-            columns={"value": "active_contributors"}
-        )
-        _merged_seg = pd.merge(_ao_df_seg, _ac_df_seg, on="slug", how="inner")
-        _merged_seg["org_diversity_ratio"] = (
-            _merged_seg["active_organizations"]
-            / _merged_seg["active_contributors"]
-        )
-
-        # Simple classifier function
-        def classify_project(row):
-            slugs = (
-                " ".join(row["collectionsSlugs"]).lower()
-                if isinstance(row["collectionsSlugs"], list)
-                else ""
-            )
-            name = row["name"].lower()
-            text = slugs + " " + name
-
-            library_keywords = [
-                "library",
-                "sdk",
-                "framework",
-                "toolkit",
-                "plugin",
-                "module",
-                "api",
-                "standard",
-                "spec",
-                "protocol",
-                "connector",
-                "driver",
-            ]
-            app_keywords = [
-                "platform",
-                "application",
-                "server",
-                "client",
-                "dashboard",
-                "system",
-                "database",
-                "service",
-                "desktop",
-                "mobile",
-                "app",
-            ]
-
-            is_lib = any(k in text for k in library_keywords)
-            is_app = any(k in text for k in app_keywords)
-
-            if is_lib and not is_app:
-                return "Library/Tool"
-            elif is_app and not is_lib:
-                return "End-User App"
-            elif is_lib and is_app:
-                return "Hybrid/Platform"  # e.g. a platform that also has an SDK
-            else:
-                return "Unclassified"
-
-        _merged_seg["type"] = _merged_seg.apply(classify_project, axis=1)
-
-        # Filter for high diversity ratio (> 0.5) and reasonable org count (> 5)
-        _hidden_gems = _merged_seg[
-            (_merged_seg["org_diversity_ratio"] > 0.5)
-            & (_merged_seg["active_organizations"] > 5)
-        ].copy()
+        # Keyword classifier over the collections and name of every project,
+        # filtered for high diversity ratio (> 0.5) and reasonable org count (> 5)
+        _hidden_gems = metrics.segmented_gems(projects)
 
         print("Top 'Hidden Gems' Segmented by Type:")
         print(
@@ -646,33 +670,39 @@ def _(alt, dfs, pd):
             .head(15)
         )
 
-        chart7 = (
-            alt.Chart(_hidden_gems)
-            .mark_circle()
-            .encode(
-                x=alt.X(
-                    "active_contributors",
-                    scale=alt.Scale(type="log"),
-                    title="Active Contributors",
-                ),
-                y=alt.Y(
-                    "active_organizations",
-                    scale=alt.Scale(type="log"),
-                    title="Active Organizations",
-                ),
-                color="type",
-                size="org_diversity_ratio",
-                tooltip=[
-                    "name",
-                    "type",
-                    "active_organizations",
-                    "active_contributors",
-                    "org_diversity_ratio",
-                ],
+        def _chart7():
+            import altair as alt
+
+            chart = (
+                alt.Chart(_hidden_gems)
+                .mark_circle()
+                .encode(
+                    x=alt.X(
+                        "active_contributors",
+                        scale=alt.Scale(type="log"),
+                        title="Active Contributors",
+                    ),
+                    y=alt.Y(
+                        "active_organizations",
+                        scale=alt.Scale(type="log"),
+                        title="Active Organizations",
+                    ),
+                    color="type",
+                    size="org_diversity_ratio",
+                    tooltip=[
+                        "name",
+                        "type",
+                        "active_organizations",
+                        "active_contributors",
+                        "org_diversity_ratio",
+                    ],
+                )
+                .properties(title="Hidden Gems Segmentation: Libraries vs. Apps")
+                .interactive()
             )
-            .properties(title="Hidden Gems Segmentation: Libraries vs. Apps")
-            .interactive()
-        )
+            return chart
+
+        chart7 = show_chart(_chart7)
 
     else:
         print("Required datasets not found.")
@@ -698,39 +728,15 @@ def _(mo):
 
 
 @app.cell
-def _(alt, dfs, pd):
+def _(chartdata, dfs, metrics, projects, show_chart):
     if "codebase-size" in dfs and "commit-activity" in dfs:
-        _cs_df_churn = dfs["codebase-size"][
-            ["name", "slug", "value", "previousPeriodValue"]
-        ].rename(
-            columns={"value": "current_loc", "previousPeriodValue": "prev_loc"}
-        )
-        _ca_df_churn = dfs["commit-activity"][["slug", "value"]].rename(
-            columns={"value": "commits"}
-        )
-
-        _merged_churn = pd.merge(
-            _cs_df_churn, _ca_df_churn, on="slug", how="inner"
-        )
-
-        # Calculate Net Line Change
-        _merged_churn["net_line_change"] = (
-            _merged_churn["current_loc"] - _merged_churn["prev_loc"]
-        ).abs()
-
-        # Avoid division by zero
-        _merged_churn["churn_ratio_proxy"] = _merged_churn.apply(
-            lambda row: (
-                row["commits"] / row["net_line_change"]
-                if row["net_line_change"] > 0
-                else row["commits"]
-            ),  # If 0 change, ratio is infinite (just use commits as score)
-            axis=1,
-        )
+        # Commits per net line change; with no net change the ratio is
+        # infinite, so the commit count is used as the score
+        _merged_churn = metrics.churn(projects)
 
         # Filter for significant activity
         _high_churn = (
-            _merged_churn[_merged_churn["commits"] > 100]
+            metrics.active_churn(projects)
             .sort_values("churn_ratio_proxy", ascending=False)
             .head(10)
         )
@@ -742,35 +748,58 @@ def _(alt, dfs, pd):
             ]
         )
 
-        chart8 = (
-            alt.Chart(_merged_churn[_merged_churn["commits"] > 100])
-            .mark_circle()
-            .encode(
-                x=alt.X(
-                    "net_line_change",
-                    scale=alt.Scale(type="log"),
-                    title="Net Line Change (Growth)",
-                ),
-                y=alt.Y(
-                    "commits",
-                    scale=alt.Scale(type="log"),
-                    title="Commits (Activity)",
-                ),
-                color=alt.Color(
-                    "churn_ratio_proxy",
-                    scale=alt.Scale(scheme="viridis", reverse=True),
-                    title="Churn Proxy",
-                ),
-                tooltip=[
-                    "name",
-                    "commits",
-                    "net_line_change",
-                    "churn_ratio_proxy",
-                ],
+        def _chart8():
+            import altair as alt
+
+            points, density = chartdata.downsample(
+                metrics.active_churn(projects),
+                "net_line_change",
+                "commits",
+                log_x=True,
+                log_y=True,
+                top={"churn_ratio_proxy": 50},
+            )
+            chart = (
+                alt.Chart(points)
+                .mark_circle()
+                .encode(
+                    x=alt.X(
+                        "net_line_change",
+                        scale=alt.Scale(type="log"),
+                        title="Net Line Change (Growth)",
+                    ),
+                    y=alt.Y(
+                        "commits",
+                        scale=alt.Scale(type="log"),
+                        title="Commits (Activity)",
+                    ),
+                    color=alt.Color(
+                        "churn_ratio_proxy",
+                        scale=alt.Scale(scheme="viridis", reverse=True),
+                        title="Churn Proxy",
+                    ),
+                    tooltip=[
+                        "name",
+                        "commits",
+                        "net_line_change",
+                        "churn_ratio_proxy",
+                    ],
+                )
+                .properties(title="Activity vs. Growth (Churn Analysis)")
+                .interactive()
             )
-            .properties(title="Activity vs. Growth (Churn Analysis)")
-            .interactive()
-        )
+            return chartdata.with_density(
+                chart,
+                density,
+                "net_line_change",
+                "commits",
+                log_x=True,
+                log_y=True,
+                x_title="Net Line Change (Growth)",
+                y_title="Commits (Activity)",
+            )
+
+        chart8 = show_chart(_chart8)
 
     else:
         print("Required datasets not found.")
@@ -804,244 +833,18 @@ def _(mo):
 
 
 @app.cell
-def _(dfs, pd):
-    def generate_report():
-        report_data = {}
-
-        # 1. Efficiency data (matches Section 2: David vs. Goliath)
-        if "active-contributors" in dfs and "commit-activity" in dfs:
-            _ac_df = dfs["active-contributors"][["name", "slug", "value"]].rename(
-                columns={"value": "active_contributors"}
-            )
-            _ca_df = dfs["commit-activity"][["slug", "value"]].rename(
-                columns={"value": "commits"}
-            )
-            merged_df = pd.merge(_ac_df, _ca_df, on="slug", how="inner")
-            merged_df["commits_per_contributor"] = (
-                merged_df["commits"] / merged_df["active_contributors"]
-            )
-            report_data["efficiency"] = merged_df.nlargest(
-                50, "commits_per_contributor"
-            ).to_dict(orient="records")
-            report_data["efficiency_all"] = merged_df.to_dict(orient="records")
-
-        # 2. Response vs Resolution (matches Section 3: The "Triage Trap")
-        if "fastest-responders" in dfs and "resolution-rate" in dfs:
-            fr_df = dfs["fastest-responders"][["name", "slug", "value"]].rename(
-                columns={"value": "response_time_hours"}
-            )
-            rr_df = dfs["resolution-rate"][["slug", "value"]].rename(
-                columns={"value": "resolution_rate"}
-            )
-            merged_rr_fr = pd.merge(fr_df, rr_df, on="slug", how="inner")
-            report_data["response_resolution"] = merged_rr_fr.to_dict(
-                orient="records"
-            )
-            report_data["correlation"] = float(
-                merged_rr_fr["response_time_hours"].corr(
-                    merged_rr_fr["resolution_rate"]
-                )
-            )
-
-        # 3. Growth vs Maintenance (matches Section 4: Growth vs. Maintenance)
-        if "codebase-size" in dfs and "commit-activity" in dfs:
-            cs_df = dfs["codebase-size"][["name", "slug", "value"]].rename(
-                columns={"value": "codebase_size"}
-            )
-            _ca_df = dfs["commit-activity"][["slug", "value"]].rename(
-                columns={"value": "commits"}
-            )
-            merged_cs_ca = pd.merge(cs_df, _ca_df, on="slug", how="inner")
-            merged_cs_ca["maintenance_ratio"] = (
-                merged_cs_ca["commits"] / merged_cs_ca["codebase_size"]
-            )
-            report_data["growth_maintenance"] = merged_cs_ca.to_dict(
-                orient="records"
-            )
-            report_data["top_maintenance"] = merged_cs_ca.nlargest(
-                15, "maintenance_ratio"
-            ).to_dict(orient="records")
-
-        # 4. Hidden Gems (matches Section 5: Finding "Hidden Gems")
-        if "active-organizations" in dfs and "active-contributors" in dfs:
-            ao_df = dfs["active-organizations"][["name", "slug", "value"]].rename(
-                columns={"value": "active_organizations"}
-            )
-            _ac_df = dfs["active-contributors"][["slug", "value"]].rename(
-                columns={"value": "active_contributors"}
-            )
-            merged_org_cont = pd.merge(ao_df, _ac_df, on="slug", how="inner")
-            merged_org_cont["org_diversity_ratio"] = (
-                merged_org_cont["active_organizations"]
-                / merged_org_cont["active_contributors"]
-            )
-            filtered_org_cont = merged_org_cont[
-                merged_org_cont["active_contributors"] > 50
-            ]
-            report_data["hidden_gems"] = filtered_org_cont.nlargest(
-                20, "org_diversity_ratio"
-            ).to_dict(orient="records")
-            report_data["org_diversity_all"] = filtered_org_cont.to_dict(
-                orient="records"
-            )
-
-        # 5. Bus Factor (matches Section 6: Small Teams, Massive Output)
-        if "small-teams-massive-output" in dfs:
-            st_df = dfs["small-teams-massive-output"][
-                ["name", "slug", "value", "collectionsSlugs"]
-            ].rename(columns={"value": "commits"})
-            report_data["bus_factor"] = st_df.nlargest(20, "commits").to_dict(
-                orient="records"
-            )
-
-        # 6. Burnout Risk (matches Section 7: The "Red Alert" List)
-        if "focused-teams" in dfs and "commit-activity" in dfs:
-            _ft_df_burnout = dfs["focused-teams"][["name", "slug", "value"]].rename(
-                columns={"value": "productivity_score"}
-            )
-            _ca_df_burnout = dfs["commit-activity"][
-                ["slug", "value", "previousPeriodValue"]
-            ].rename(
-                columns={"value": "commits", "previousPeriodValue": "prev_commits"}
-            )
-            _merged_burnout = pd.merge(
-                _ft_df_burnout, _ca_df_burnout, on="slug", how="inner"
-            )
-            _merged_burnout["momentum"] = _merged_burnout.apply(
-                lambda row: (
-                    (row["commits"] - row["prev_commits"]) / row["prev_commits"]
-                    if row["prev_commits"] > 0
-                    else 0
-                ),
-                axis=1,
-            )
-            _declining_projects = _merged_burnout[
-                (_merged_burnout["momentum"] < -0.1)
-                & (_merged_burnout["commits"] > 100)
-            ].nsmallest(15, "momentum")
-            report_data["burnout_risk"] = _declining_projects.to_dict(
-                orient="records"
-            )
-            report_data["burnout_all"] = _merged_burnout.to_dict(orient="records")
-
-        # 7. Churn Analysis (matches Section 9: The "Churn" Trap)
-        if "codebase-size" in dfs and "commit-activity" in dfs:
-            _cs_df_churn = dfs["codebase-size"][
-                ["name", "slug", "value", "previousPeriodValue"]
-            ].rename(
-                columns={"value": "current_loc", "previousPeriodValue": "prev_loc"}
-            )
-            _ca_df_churn = dfs["commit-activity"][["slug", "value"]].rename(
-                columns={"value": "commits"}
-            )
-            _merged_churn = pd.merge(
-                _cs_df_churn, _ca_df_churn, on="slug", how="inner"
-            )
-            _merged_churn["net_line_change"] = (
-                _merged_churn["current_loc"] - _merged_churn["prev_loc"]
-            ).abs()
-            _merged_churn["churn_ratio_proxy"] = _merged_churn.apply(
-                lambda row: (
-                    row["commits"] / row["net_line_change"]
-                    if row["net_line_change"] > 0
-                    else row["commits"]
-                ),
-                axis=1,
-            )
-            _churn_filtered = _merged_churn[_merged_churn["commits"] > 100]
-            report_data["churn_high"] = _churn_filtered.nlargest(
-                15, "churn_ratio_proxy"
-            ).to_dict(orient="records")
-            report_data["churn_all"] = _churn_filtered.to_dict(orient="records")
-
-        # 8. Libraries vs Apps segmentation (matches Section 8)
-        if "active-organizations" in dfs and "active-contributors" in dfs:
-            _ao_df_seg = dfs["active-organizations"][
-                ["name", "slug", "value", "collectionsSlugs"]
-            ].rename(columns={"value": "active_organizations"})
-            _ac_df_seg = dfs["active-contributors"][["slug", "value"]].rename(
-                columns={"value": "active_contributors"}
-            )
-            _merged_seg = pd.merge(_ao_df_seg, _ac_df_seg, on="slug", how="inner")
-            _merged_seg["org_diversity_ratio"] = (
-                _merged_seg["active_organizations"]
-                / _merged_seg["active_contributors"]
-            )
-
-            def classify_project(row):
-                slugs = (
-                    " ".join(row["collectionsSlugs"]).lower()
-                    if isinstance(row["collectionsSlugs"], list)
-                    else ""
-                )
-                name = row["name"].lower()
-                text = slugs + " " + name
-                library_keywords = [
-                    "library",
-                    "sdk",
-                    "framework",
-                    "toolkit",
-                    "plugin",
-                    "module",
-                    "api",
-                    "standard",
-                    "spec",
-                    "protocol",
-                    "connector",
-                    "driver",
-                ]
-                app_keywords = [
-                    "platform",
-                    "application",
-                    "server",
-                    "client",
-                    "dashboard",
-                    "system",
-                    "database",
-                    "service",
-                    "desktop",
-                    "mobile",
-                    "app",
-                ]
-                is_lib = any(k in text for k in library_keywords)
-                is_app = any(k in text for k in app_keywords)
-                if is_lib and not is_app:
-                    return "Library/Tool"
-                elif is_app and not is_lib:
-                    return "End-User App"
-                elif is_lib and is_app:
-                    return "Hybrid/Platform"
-                else:
-                    return "Unclassified"
-
-            _merged_seg["type"] = _merged_seg.apply(classify_project, axis=1)
-            _hidden_gems = _merged_seg[
-                (_merged_seg["org_diversity_ratio"] > 0.5)
-                & (_merged_seg["active_organizations"] > 5)
-            ].copy()
-
-            _hidden_gems["collectionsSlugs"] = _hidden_gems[
-                "collectionsSlugs"
-            ].apply(lambda x: ", ".join(x) if isinstance(x, list) else str(x))
-            report_data["segmented_gems"] = _hidden_gems.nlargest(
-                30, "org_diversity_ratio"
-            ).to_dict(orient="records")
-
-        return report_data
-    return (generate_report,)
-
-
-@app.cell
-def _(generate_report, json, os):
+def _(dfs, os, profiling, projects, report):
     os.makedirs("datastory/", exist_ok=True)
 
-    # Save to JSON file
-    report_data = generate_report()
-    with open("datastory/report_data.json", "w") as _f:
-        json.dump(report_data, _f)
+    # Save to JSON file. The sections are defined in report.py; only those
+    # whose leaderboards changed since the last export are recomputed, and
+    # each is streamed to the file as it is serialized
+    report_keys = report.update_report("datastory/report_data.json", dfs, projects)
 
-    print(f"Exported {len(report_data)} datasets to datastory/report_data.json")
-    print("Keys:", list(report_data.keys()))
+    print(f"Exported {len(report_keys)} datasets to datastory/report_data.json")
+    print("Keys:", report_keys)
+    if profiling.enabled:
+        profiling.write_trace()
     return
 
 
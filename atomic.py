@@ -0,0 +1,41 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Every file the pipeline publishes (datasets, Feather copies, caches, report,
+# shards, state and traces) is written to a *.part file next to it and renamed
+# over it once complete, so readers never see a half-written file. Part names
+# are unique to the writing process and thread: notebooks, exports and scrapes
+# running side by side may write the same file at once, and the last complete
+# copy wins
+
+
+def part_path(path: Path, tag: str = ""):
+    return path.with_name(
+        f"{path.name}{tag}.{os.getpid()}-{threading.get_ident()}.part"
+    )
+
+
+@contextmanager
+def replacing(path: Path):
+    # Yields the part file to write; it replaces `path` once the block
+    # completes and is removed if the block or the rename fails
+    part = part_path(path)
+    try:
+        yield part
+        os.replace(part, path)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+
+
+def write_bytes(path: Path, data: bytes):
+    with replacing(path) as part:
+        part.write_bytes(data)
+
+
+def write_json(path: Path, obj):
+    with replacing(path) as part, open(part, "w") as f:
+        json.dump(obj, f)
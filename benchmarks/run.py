@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import synthetic
+
+import loader
+import metrics
+import report
+import scraper
+
+# Times each stage of the pipeline on synthetic leaderboards (see synthetic.py)
+# and compares the results with baseline.json, flagging stages that got slower
+# than the baseline by more than the threshold. Every stage is run `repeat`
+# times and the fastest run is kept:
+#   scraper.save    scraper.save_leaderboards() (JSON and Feather copy)
+#   load.<mode>     loader.load_datasets() in json and columnar mode
+#   section.<name>  one report section from loaded frames, metrics included
+#   export          report.update_report() of every section from scratch
+baseline_path = Path(__file__).parent / "baseline.json"
+stage_groups = ["save", "load", "section", "export"]
+
+
+def _best(function, repeat: int):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _cold(function, *args, **kwargs):
+    # Every run recomputes its metrics and project groups
+    metrics.clear_cache()
+    return function(*args, **kwargs)
+
+
+def run_scale(scale: int, repeat: int, groups: list[str], seed: int = 0):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix=f"lfx-bench-{scale}x-") as tmp:
+        path = Path(tmp) / "datasets"
+        os.makedirs(path)
+        scraper.dataset_path = path
+
+        # The synthetic datasets are written through the scraper's save path,
+        # one leaderboard at a time to bound memory at large scales
+        save = 0.0
+        for lb_type, entries in synthetic.iter_leaderboards(scale, seed):
+            save += _best(
+                lambda lb_type=lb_type, entries=entries: scraper.save_leaderboards(
+                    {lb_type: entries}, "full"
+                ),
+                repeat if "save" in groups else 1,
+            )
+        if "save" in groups:
+            results["scraper.save"] = save
+
+        if "load" in groups:
+            for mode in ("json", "columnar"):
+                results[f"load.{mode}"] = _best(
+                    lambda mode=mode: loader.load_datasets(path, mode=mode), repeat
+                )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            dfs = loader.load_datasets(path)
+        if "section" in groups:
+            for name, (function, _) in report.sections.items():
+                results[f"section.{name}"] = _best(
+                    # A new project table per run, so every run is cold
+                    lambda function=function: _cold(
+                        function, dfs, loader.LazyProjectTable(dfs)
+                    ),
+                    repeat,
+                )
+        if "export" in groups:
+            output = Path(tmp) / "report_data.json"
+            results["export"] = _best(
+                lambda: _cold(
+                    report.update_report,
+                    output,
+                    dfs,
+                    loader.LazyProjectTable(dfs),
+                    force=True,
+                ),
+                repeat,
+            )
+    metrics.clear_cache()
+    return {stage: round(seconds, 6) for stage, seconds in results.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float):
+    # Print every stage against the baseline; returns the stages that are
+    # slower by more than `threshold` (a fraction) and `min_delta` seconds
+    slower = []
+    print(f"{'stage':<32}{'baseline':>12}{'current':>12}{'change':>10}")
+    for scale, stages in results.items():
+        for stage, seconds in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            label = f"{scale}x {stage}"
+            if base is None:
+                print(f"{label:<32}{'-':>12}{seconds * 1000:>10.1f}ms{'new':>10}")
+                continue
+            change = seconds / base - 1
+            flag = change > threshold and seconds - base > min_delta
+            if flag:
+                slower.append(label)
+            print(
+                f"{label:<32}{base * 1000:>10.1f}ms{seconds * 1000:>10.1f}ms"
+                f"{change:>+10.0%}{'  SLOWER' if flag else ''}"
+            )
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline on synthetic leaderboards"
+    )
+    parser.add_argument(
+        "--scales", default="1,10", help="comma-separated scales, e.g. 1,10,100"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--stages",
+        default=",".join(stage_groups),
+        help=f"comma-separated stage groups ({', '.join(stage_groups)})",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="flag stages slower than the baseline by more than this fraction",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.005,
+        help="ignore slowdowns smaller than this many seconds",
+    )
+    parser.add_argument("--baseline", type=Path, default=baseline_path)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the baseline for their scales",
+    )
+    parser.add_argument("--output", type=Path, help="also write the results here")
+    args = parser.parse_args()
+
+    groups = args.stages.split(",")
+    unknown = set(groups) - set(stage_groups)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    # Measure the pipeline itself, not the metric table cache
+    metrics.cache_enabled = False
+
+    results = {}
+    for scale in args.scales.split(","):
+        start = time.perf_counter()
+        results[scale] = run_scale(int(scale), args.repeat, groups)
+        print(f"Benchmarked {scale}x in {time.perf_counter() - start:.1f}s")
+
+    try:
+        baseline = json.loads(args.baseline.read_text())
+    except OSError:
+        baseline = {"scales": {}}
+    slower = compare(results, baseline["scales"], args.threshold, args.min_delta)
+
+    record = {
+        "recorded": date.today().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    if args.output:
+        args.output.write_text(json.dumps({**record, "scales": results}, indent=2))
+    if args.save_baseline:
+        baseline.update(record)
+        baseline["scales"].update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Saved the baseline for {', '.join(results)}x to {args.baseline}")
+    elif slower:
+        print(f"Slower than the baseline: {', '.join(slower)}")
+        sys.exit(1)
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Synthetic leaderboards with the shape of the LFX data: every field of an
+# entry, the same id/name/collections for a project across leaderboards, the
+# real overlap between leaderboards, correlated activity figures and the
+# value types, orderings and quirks (uint64 wrap-around, zero previous values)
+# of each leaderboardType. Sizes are those of the 2026-01 scrape times `scale`
+
+# leaderboardType -> entries at scale 1
+sizes = {
+    "active-contributors": 5065,
+    "active-organizations": 5065,
+    "commit-activity": 4901,
+    "focused-teams": 4880,
+    "resolution-rate": 435,
+    "fastest-mergers": 395,
+    "fastest-responders": 379,
+    "codebase-size": 348,
+    "small-teams-massive-output": 138,
+    "contributors": 100,
+    "organizations": 100,
+}
+leaderboard_types = list(sizes)
+# Ranked by the smallest value first
+ascending_types = {"fastest-mergers", "fastest-responders"}
+
+# Name and collection words, including the keywords metrics.classify_projects()
+# looks for, so the segmentation has something to find
+words = [
+    "open", "cloud", "data", "stream", "edge", "kube", "graph", "secure",
+    "fast", "micro", "net", "vector", "flow", "core", "hyper", "quantum",
+    "sdk", "server", "app", "platform", "library", "client", "api", "plugin",
+    "database", "dashboard", "framework", "toolkit", "driver", "service",
+    "mobile", "desktop", "protocol", "spec", "module", "connector", "system",
+]  # fmt: skip
+collection_words = [
+    "ml", "libraries", "toolkits", "application", "servers", "web",
+    "frameworks", "cli", "tools", "data", "pipelines", "observability",
+    "security", "networking", "storage", "drivers", "plugins", "runtimes",
+    "compilers", "editors", "service", "mesh", "mobile", "apps", "databases",
+    "cncf", "lfn", "open", "mainframe", "ides", "sdks", "testing", "platforms",
+]  # fmt: skip
+people = ["Alex", "Sam", "Kim", "Robin", "Jordan", "Avery", "Quinn", "Riley"]
+surnames = ["Smith", "James", "Garcia", "Chen", "Novak", "Okafor", "Ito", "Berg"]
+
+
+def _uuids(rng: np.random.Generator, n: int):
+    return [
+        str(uuid.UUID(bytes=bytes(row), version=4))
+        for row in rng.integers(0, 256, (n, 16), dtype=np.uint8)
+    ]
+
+
+def _collections(rng: np.random.Generator, scale: int):
+    # Popularity follows a power law, like the real collection slugs
+    count = int(1700 * scale**0.5)
+    first = rng.choice(collection_words, count)
+    second = rng.choice(collection_words, count)
+    pool = [f"{a}-{b}-{i}" for i, (a, b) in enumerate(zip(first, second))]
+    weights = 1 / np.arange(1, count + 1) ** 1.1
+    return pool, weights / weights.sum()
+
+
+def _pick_collections(rng, pool, weights, counts):
+    picks = rng.choice(len(pool), int(counts.sum()), p=weights)
+    lists, start = [], 0
+    for count in counts:
+        lists.append(list(dict.fromkeys(pool[i] for i in picks[start : start + count])))
+        start += count
+    return lists
+
+
+def _projects(rng: np.random.Generator, n: int, pool, weights, prefix: str):
+    first = rng.choice(words, n)
+    second = rng.choice(words, n)
+    slugs = [f"{prefix}{a}-{b}-{i}" for i, (a, b) in enumerate(zip(first, second))]
+    has_logo = rng.random(n) < 0.5
+    contributors = np.clip(np.rint(rng.lognormal(np.log(116), 1.4, n)), 1, 30_000)
+    return {
+        "id": _uuids(rng, n),
+        "segmentId": _uuids(rng, n),
+        "name": [
+            f"{a.title()} {b.title()} {i}"
+            for i, (a, b) in enumerate(zip(first, second))
+        ],
+        "slug": slugs,
+        "logoUrl": [
+            f"https://avatars.githubusercontent.com/u/{i}?v=4" if logo else ""
+            for i, logo in enumerate(has_logo)
+        ],
+        "collectionsSlugs": _pick_collections(
+            rng, pool, weights, np.clip(rng.poisson(1.8, n), 0, 47)
+        ),
+        "isLF": rng.random(n) < 0.12,
+        # Latent activity the leaderboard values are derived from
+        "contributors": contributors.astype(np.int64),
+        "commits": np.maximum(
+            1, np.rint(contributors * rng.lognormal(np.log(2.7), 1.0, n))
+        ).astype(np.int64),
+    }
+
+
+def _previous(rng: np.random.Generator, values: np.ndarray, zeros: float):
+    previous = np.rint(values * rng.lognormal(0, 0.5, len(values))).astype(np.uint64)
+    previous[rng.random(len(values)) < zeros] = 0
+    return previous
+
+
+def _lf_first(rng: np.random.Generator, is_lf: np.ndarray, lf_share: float):
+    # A random order of the projects in which about lf_share of any prefix are
+    # Linux Foundation projects
+    weights = np.where(is_lf, lf_share / max(is_lf.mean(), 1e-9), 1 - lf_share)
+    return rng.choice(len(is_lf), len(is_lf), replace=False, p=weights / weights.sum())
+
+
+def _board(rng, lb_type: str, projects: dict, rows: np.ndarray):
+    n = len(rows)
+    contributors = projects["contributors"][rows]
+    commits = projects["commits"][rows]
+    previous = np.zeros(n, dtype=np.uint64)
+    if lb_type == "active-contributors":
+        values = contributors
+        previous = _previous(rng, values, 0.01)
+    elif lb_type == "active-organizations":
+        values = np.maximum(1, np.rint(contributors * rng.beta(2, 8, n))).astype(
+            np.int64
+        )
+        previous = _previous(rng, values, 0.01)
+    elif lb_type == "commit-activity":
+        values = commits
+        previous = _previous(rng, values, 0.01)
+    elif lb_type == "focused-teams":
+        values = commits / np.sqrt(contributors) * rng.lognormal(1.0, 0.5, n)
+    elif lb_type == "resolution-rate":
+        values = 100 * rng.beta(0.5, 15, n)
+        values[rng.random(n) < 0.05] = 0
+    elif lb_type in ascending_types:
+        values = np.maximum(17, np.rint(rng.lognormal(np.log(1.1e6), 2, n))).astype(
+            np.uint64
+        )
+        previous = _previous(rng, values, 0.05)
+        if lb_type == "fastest-mergers":
+            # LFX reports some merge times that wrapped around below zero
+            for column in (values, previous):
+                wrapped = rng.random(n) < 0.01
+                column[wrapped] = np.uint64(2**64 - 1) - rng.integers(
+                    10**8, 2 * 10**8, wrapped.sum()
+                ).astype(np.uint64)
+    elif lb_type == "codebase-size":
+        values = np.clip(np.rint(rng.lognormal(np.log(1e5), 2.5, n)), 1, 1.2e9).astype(
+            np.int64
+        )
+    elif lb_type == "small-teams-massive-output":
+        values = np.maximum(1, np.rint(rng.lognormal(np.log(241), 1.5, n))).astype(
+            np.int64
+        )
+    else:  # contributors, organizations
+        median = 15_000 if lb_type == "contributors" else 52_000
+        values = np.rint(rng.lognormal(np.log(median), 0.6, n)).astype(np.int64)
+        previous = _previous(rng, values, 0.01)
+
+    order = np.argsort(values, kind="stable")
+    if lb_type not in ascending_types:
+        order = order[::-1]
+    entries = []
+    for rank, i in enumerate(order, 1):
+        row = rows[i]
+        value = values[i].item()
+        # Rates and scores are floats unless they happen to be whole numbers
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        entries.append(
+            {
+                "rank": rank,
+                "id": projects["id"][row],
+                "segmentId": projects["segmentId"][row],
+                "name": projects["name"][row],
+                "slug": projects["slug"][row],
+                "logoUrl": projects["logoUrl"][row],
+                "leaderboardType": lb_type,
+                "value": value,
+                "previousPeriodValue": previous[i].item(),
+                "collectionsSlugs": projects["collectionsSlugs"][row],
+                "isLF": bool(projects["isLF"][row]),
+            }
+        )
+    return entries
+
+
+def iter_leaderboards(scale: int = 1, seed: int = 0):
+    # Yield (leaderboardType, entries) one leaderboard at a time, so large
+    # scales never hold more than one of them as Python objects
+    rng = np.random.default_rng(seed)
+    pool, weights = _collections(rng, scale)
+    core = _projects(rng, sizes["active-contributors"] * scale, pool, weights, "")
+    # Projects that only appear on the smaller leaderboards
+    extra = _projects(rng, 100 * scale, pool, weights, "x-")
+    merged = {
+        key: core[key] + extra[key]
+        if isinstance(core[key], list)
+        else np.concatenate([core[key], extra[key]])
+        for key in core
+    }
+    n_core = len(core["slug"])
+    # The smaller project leaderboards are mostly Linux Foundation projects and
+    # mostly the same ones
+    lf_order = _lf_first(rng, core["isLF"], 0.95)
+
+    for lb_type in leaderboard_types:
+        n = sizes[lb_type] * scale
+        if lb_type in ("contributors", "organizations"):
+            # People and organizations have no project slug or segment
+            members = _projects(rng, n, pool, weights, "")
+            members["collectionsSlugs"] = _pick_collections(
+                rng,
+                pool,
+                weights,
+                np.minimum(
+                    rng.poisson(16 if lb_type == "contributors" else 184, n), len(pool)
+                ),
+            )
+            if lb_type == "contributors":
+                members["name"] = [
+                    f"{rng.choice(people)} {rng.choice(surnames)} {i}" for i in range(n)
+                ]
+            else:
+                members["name"] = [f"Organization {i}, Inc." for i in range(n)]
+            members["slug"] = [""] * n
+            members["segmentId"] = [""] * n
+            members["isLF"] = np.zeros(n, dtype=bool)
+            yield lb_type, _board(rng, lb_type, members, np.arange(n))
+            continue
+        if lb_type in ("active-contributors", "active-organizations"):
+            rows = np.arange(n_core)
+        elif lb_type in ("commit-activity", "focused-teams"):
+            rows = np.sort(rng.choice(n_core, n, replace=False))
+        elif lb_type == "small-teams-massive-output":
+            # Teams of at most 50 contributors, a third of them missing from
+            # the other leaderboards
+            small = np.flatnonzero(merged["contributors"][:n_core] <= 50)
+            rows = np.concatenate(
+                [
+                    rng.choice(small, min(len(small), n - n // 3), replace=False),
+                    n_core + rng.choice(len(extra["slug"]), n // 3, replace=False),
+                ]
+            )
+        else:
+            rows = np.concatenate(
+                [
+                    lf_order[: n - n // 25],
+                    n_core + rng.choice(len(extra["slug"]), n // 25, replace=False),
+                ]
+            )
+        yield lb_type, _board(rng, lb_type, merged, rows)
+
+
+def write_datasets(path: Path, scale: int = 1, seed: int = 0):
+    # datasets/-style <type>_full.json files; returns the entries per type
+    os.makedirs(path, exist_ok=True)
+    counts = {}
+    for lb_type, entries in iter_leaderboards(scale, seed):
+        with open(Path(path) / f"{lb_type}_full.json", "w") as f:
+            json.dump(entries, f)
+        counts[lb_type] = len(entries)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write synthetic LFX leaderboards for benchmarks"
+    )
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    counts = write_datasets(args.out, args.scale, args.seed)
+    print(f"Wrote {sum(counts.values())} entries to {args.out}")
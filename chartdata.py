@@ -0,0 +1,112 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Scatter charts embed their data in the Vega-Lite spec, so their size (and
+# Altair's row limit) grows with the number of projects. downsample()
+# keeps a chart's data bounded: up to max_points rows are embedded as they
+# are, beyond that the dense regions of a bins x bins grid (log-scaled along
+# log axes) are aggregated into one cell each, while the projects in sparse
+# cells (the outliers) and the top/bottom rows of chosen columns stay
+# individual, labeled points. That is at most
+# bins**2 * min_count + sum(top) + sum(bottom) rows whatever the project count
+max_points = 5000
+bins = 30
+min_count = 3
+
+
+def _axis(values: pd.Series, log: bool):
+    values = values.astype(float)
+    if log:
+        # A log axis can't show these, so they are left out as they are today
+        values = np.log10(values.where(values > 0))
+    return values.where(np.isfinite(values))
+
+
+def _cells(values: pd.Series, bins: int):
+    edges = np.linspace(values.min(), values.max(), bins + 1)
+    return np.digitize(values, edges[1:-1])
+
+
+def downsample(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    log_x: bool = False,
+    log_y: bool = False,
+    top: Optional[dict[str, int]] = None,
+    bottom: Optional[dict[str, int]] = None,
+    max_points: int = max_points,
+    bins: int = bins,
+    min_count: int = min_count,
+):
+    # Returns (points, density): the rows to draw individually and one row per
+    # aggregated cell with the median x and y of its projects and their count
+    # in "projects". density is empty while df has at most max_points rows
+    density = pd.DataFrame({x: [], y: [], "projects": []})
+    if len(df) <= max_points:
+        return df, density
+
+    coords = [_axis(df[x], log_x), _axis(df[y], log_y)]
+    visible = (coords[0].notna() & coords[1].notna()).to_numpy()
+    df = df[visible]
+    cell = _cells(coords[0][visible], bins) * bins + _cells(coords[1][visible], bins)
+    individual = np.bincount(cell, minlength=bins * bins)[cell] < min_count
+    for column, n in (top or {}).items():
+        individual |= df.index.isin(df[column].nlargest(n).index)
+    for column, n in (bottom or {}).items():
+        individual |= df.index.isin(df[column].nsmallest(n).index)
+
+    dense = df[~individual]
+    density = (
+        dense.groupby(cell[~individual])
+        .agg(**{x: (x, "median"), y: (y, "median"), "projects": (x, "size")})
+        .reset_index(drop=True)
+    )
+    return df[individual], density
+
+
+def regression_line(df: pd.DataFrame, x: str, y: str):
+    # The two ends of the least-squares line of y on x over every row of df,
+    # for charts whose points were downsampled (a Vega-Lite regression
+    # transform would only see the points that are left)
+    fit = df[[x, y]].astype(float).dropna()
+    slope = fit[x].cov(fit[y]) / fit[x].var()
+    ends = pd.DataFrame({x: [fit[x].min(), fit[x].max()]})
+    ends[y] = fit[y].mean() + slope * (ends[x] - fit[x].mean())
+    return ends
+
+
+def with_density(
+    chart,
+    density: pd.DataFrame,
+    x: str,
+    y: str,
+    log_x: bool = False,
+    log_y: bool = False,
+    x_title: Optional[str] = None,
+    y_title: Optional[str] = None,
+):
+    # Draw the aggregated cells of downsample() under a scatter chart, sized by
+    # the number of projects in them. The titles must match the chart's, or
+    # Vega-Lite joins the two
+    if density.empty:
+        return chart
+    import altair as alt
+
+    cells = (
+        alt.Chart(density)
+        .mark_square(color="gray", opacity=0.35)
+        .encode(
+            x=alt.X(
+                x, scale=alt.Scale(type="log" if log_x else "linear"), title=x_title
+            ),
+            y=alt.Y(
+                y, scale=alt.Scale(type="log" if log_y else "linear"), title=y_title
+            ),
+            size=alt.Size("projects", title="Projects (aggregated)"),
+            tooltip=[alt.Tooltip("projects", title="Projects"), x, y],
+        )
+    )
+    return alt.layer(cells, chart).resolve_scale(size="independent")
@@ -0,0 +1,37 @@
+// Decoder for the columnar report encoding written by
+// `python report.py --encoding columnar`. Include it with
+//   <script src="../report-columnar.js"></script>
+// and pass the fetched report (or a single shard) through decodeReport().
+(function (global) {
+    function decodeColumn(column) {
+        if (Array.isArray(column)) return column;
+        if (column.lists) return column.lists.map((codes) => codes.map((i) => column.dict[i]));
+        return column.codes.map((i) => column.dict[i]);
+    }
+
+    // One encoded value back into an array of records; other values pass through
+    function decodeValue(value) {
+        if (!value || value.columnar !== 1) return value;
+        const fields = Object.keys(value.columns);
+        const columns = fields.map((field) => decodeColumn(value.columns[field]));
+        const records = new Array(value.length);
+        for (let i = 0; i < value.length; i++) {
+            const record = {};
+            for (let j = 0; j < fields.length; j++) record[fields[j]] = columns[j][i];
+            records[i] = record;
+        }
+        return records;
+    }
+
+    // A whole report ({key: value}) or a single shard. Shards of scalars (such
+    // as correlation.json) and empty lists are returned as they are
+    function decodeReport(report) {
+        if (report === null || typeof report !== "object" || Array.isArray(report)) return report;
+        if (report.columnar === 1) return decodeValue(report);
+        const decoded = {};
+        for (const [key, value] of Object.entries(report)) decoded[key] = decodeValue(value);
+        return decoded;
+    }
+
+    global.decodeReport = decodeReport;
+})(typeof window !== "undefined" ? window : globalThis);
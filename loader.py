@@ -0,0 +1,553 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import feather
+
+import atomic
+import profiling
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib decoder is used instead
+    orjson = None
+
+dataset_path = Path(__file__).parent / "datasets"
+# "json" always parses the JSON files, "columnar" prefers the up-to-date
+# Feather copies and "mmap" memory-maps them (building any that are missing)
+load_mode = os.environ.get("LFX_LOAD_MODE", "columnar")
+# Apply frame_schema to JSON/columnar loads (mmap frames are already compact)
+compact_frames = os.environ.get("LFX_COMPACT_FRAMES", "1") != "0"
+# key -> lock; see key_lock()
+_locks = {}
+_locks_guard = threading.Lock()
+
+# Columns with a fixed type in every leaderboard. `value` and
+# `previousPeriodValue` keep the type pandas infers from the JSON: int64 for
+# counts, double for rates and uint64 where LFX reports wrapped-around values
+column_types = {
+    "rank": pa.int64(),
+    "id": pa.string(),
+    "segmentId": pa.string(),
+    "name": pa.string(),
+    "slug": pa.string(),
+    "logoUrl": pa.string(),
+    "leaderboardType": pa.string(),
+    "collectionsSlugs": pa.list_(pa.string()),
+    "isLF": pa.bool_(),
+}
+
+
+# In-memory storage of every leaderboard column. "int" columns use int32 when
+# the values fit (keeping headroom for the analysis arithmetic) and stay 64-bit
+# otherwise, "string" columns are Arrow-backed, "category" suits the columns
+# with few distinct values and "collections" shares identical slug lists
+frame_schema = {
+    "rank": "int",
+    "id": "string",
+    "segmentId": "string",
+    "name": "string",
+    "slug": "string",
+    "logoUrl": "category",
+    "leaderboardType": "category",
+    "value": "int",
+    "previousPeriodValue": "int",
+    "collectionsSlugs": "collections",
+    "isLF": "bool",
+}
+# Leaderboards whose values are rates or averages rather than counts
+value_schemas = {
+    "focused-teams": {"value": "float"},
+    "resolution-rate": {"value": "float"},
+}
+
+
+def leaderboard_schema(lb_type: str):
+    return {**frame_schema, **value_schemas.get(lb_type, {})}
+
+
+def columnar_path(json_path: Path):
+    return json_path.with_suffix(".feather")
+
+
+def _arrow_table(entries: list):
+    table = pa.Table.from_pandas(pd.DataFrame(entries), preserve_index=False)
+    return table.cast(
+        pa.schema(
+            [pa.field(f.name, column_types.get(f.name, f.type)) for f in table.schema]
+        )
+    )
+
+
+def write_columnar(entries: list, path: Path):
+    # Arrow IPC (Feather v2) file, left uncompressed so it loads without decoding
+    table = _arrow_table(entries)
+    with atomic.replacing(path) as part:
+        feather.write_feather(table, part, compression="uncompressed")
+
+
+def _wider_type(old: pa.DataType, new: pa.DataType):
+    # The type pandas would infer for a column holding the values of both:
+    # integers stay integers (uint64 once LFX reports a wrapped-around value),
+    # anything else becomes float64
+    if old == new or pa.types.is_null(new):
+        return old
+    if pa.types.is_null(old):
+        return new
+    if pa.types.is_integer(old) and pa.types.is_integer(new):
+        if pa.types.is_unsigned_integer(old) or pa.types.is_unsigned_integer(new):
+            return pa.uint64()
+        return pa.int64()
+    return pa.float64()
+
+
+class ColumnarWriter:
+    # Builds the Feather copy of a leaderboard as its entries arrive,
+    # batch_rows at a time, so a streamed scrape never holds a whole
+    # leaderboard. The columns without a fixed type take the type of the first
+    # batch; when a later batch needs a wider one, the batches written so far
+    # are re-cast into a new file one at a time. The finished file has the same
+    # table as write_columnar() of all the entries
+    def __init__(self, path: Path, batch_rows: int = 1000):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.entries = []
+        self.schema = None
+        self.writer = None
+        self.widened = 0
+        self.part = atomic.part_path(path)
+
+    def write(self, entry: dict):
+        self.entries.append(entry)
+        if len(self.entries) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.entries:
+            return
+        table = _arrow_table(self.entries)
+        self.entries = []
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pa.ipc.new_file(self.part, self.schema)
+        else:
+            table = table.select(self.schema.names)
+            schema = pa.schema(
+                [
+                    pa.field(
+                        f.name, _wider_type(f.type, table.schema.field(f.name).type)
+                    )
+                    for f in self.schema
+                ]
+            )
+            if schema != self.schema:
+                self._widen(schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def _widen(self, schema: pa.Schema):
+        self.writer.close()
+        self.widened += 1
+        part = atomic.part_path(self.path, f".{self.widened}")
+        writer = pa.ipc.new_file(part, schema)
+        with pa.memory_map(str(self.part)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                writer.write_batch(reader.get_batch(i).cast(schema))
+        os.remove(self.part)
+        self.part, self.writer, self.schema = part, writer, schema
+
+    def close(self):
+        self._flush()
+        if self.writer is None:
+            write_columnar([], self.path)
+            return
+        self.writer.close()
+        os.replace(self.part, self.path)
+
+    def abort(self):
+        self.entries = []
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.part)
+
+
+def read_columnar(path: Path):
+    table = feather.read_table(path)
+    if "collectionsSlugs" not in table.column_names:
+        return table.to_pandas()
+    # Arrow would hand the list column back as numpy arrays; the analysis
+    # expects plain lists, as json.load produces, and building them directly is
+    # much cheaper than converting twice
+    position = table.column_names.index("collectionsSlugs")
+    df = table.drop_columns(["collectionsSlugs"]).to_pandas()
+    df.insert(position, "collectionsSlugs", table["collectionsSlugs"].to_pylist())
+    return df
+
+
+def _arrow_backed(arrow_type: pa.DataType):
+    if pa.types.is_string(arrow_type) or pa.types.is_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def map_columnar(path: Path):
+    # Numeric columns become numpy views of the mapping and strings/lists stay
+    # Arrow-backed, so the data lives in the OS page cache shared by every
+    # process instead of a private copy, and nothing is parsed up front
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True, types_mapper=_arrow_backed)
+
+
+def decode_json(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def read_json(path: Path):
+    return pd.DataFrame(decode_json(path.read_bytes()))
+
+
+def _fits_int32(column: pa.ChunkedArray):
+    low, high = (value.as_py() for value in pc.min_max(column).values())
+    return low is None or (-(2**31) <= low and high <= 2**31 - 1)
+
+
+def _sorted_categories(column: pa.ChunkedArray):
+    # Dictionary-encoded with the categories sorted, as astype("category")
+    # orders them
+    categories = pc.unique(column.drop_null()).sort()
+    return pa.chunked_array(
+        [
+            pa.DictionaryArray.from_arrays(
+                pc.index_in(chunk, value_set=categories), categories
+            )
+            for chunk in column.chunks
+        ],
+        pa.dictionary(pa.int32(), column.type),
+    )
+
+
+def _shared_collections(column: pa.ChunkedArray):
+    # Leaderboards repeat the same collection lists and slugs many times; keep
+    # one tuple per distinct list and one string per distinct slug. Lists are
+    # told apart in Arrow by their length and joined slugs, so only the
+    # distinct ones are built as Python objects
+    column = column.combine_chunks()
+    keys = pc.binary_join_element_wise(
+        pc.cast(pc.list_value_length(column), pa.string()),
+        pc.binary_join(column, "\x1f"),
+        "\x1e",
+    )
+    codes = pc.dictionary_encode(keys, null_encoding="encode").indices.to_numpy()
+    _, first = np.unique(codes, return_index=True)
+    distinct = column.take(first)
+    slugs = pc.dictionary_encode(distinct.flatten())
+    interned = np.array(
+        [sys.intern(slug) for slug in slugs.dictionary.to_pylist()], dtype=object
+    )
+    strings = interned[slugs.indices.to_numpy()].tolist()
+    offsets = distinct.offsets.to_pylist()
+    shared = np.empty(len(distinct), dtype=object)
+    for i, (start, end) in enumerate(itertools.pairwise(offsets)):
+        shared[i] = tuple(strings[start:end])
+    shared[distinct.is_null().to_numpy(zero_copy_only=False)] = None
+    return shared[codes]
+
+
+def compact_frame(table: pa.Table, lb_type: str):
+    # The frame of a leaderboard table with the columns stored as frame_schema
+    # declares. The columns are converted in Arrow before the table becomes a
+    # frame, so no value makes a round trip through Python objects
+    schema = leaderboard_schema(lb_type)
+    collections = {}
+    for position, name in reversed(list(enumerate(table.column_names))):
+        column, kind = table.column(position), schema.get(name)
+        if kind == "int":
+            if pa.types.is_signed_integer(column.type) and _fits_int32(column):
+                column = column.cast(pa.int32())
+        elif kind == "float":
+            column = column.cast(pa.float64())
+        elif kind == "string":
+            column = column.cast(pa.string())
+        elif kind == "category":
+            column = _sorted_categories(column)
+        elif kind == "collections":
+            collections[position] = (name, _shared_collections(column))
+            table = table.remove_column(position)
+            continue
+        elif kind == "bool":
+            column = pc.fill_null(column, False)
+        table = table.set_column(position, name, column)
+    df = table.to_pandas(types_mapper=_arrow_backed)
+    for position, (name, values) in sorted(collections.items()):
+        df.insert(position, name, values)
+    return df
+
+
+def columnar_fresh(json_path: Path):
+    # The columnar copy is only trusted when it is at least as new as the JSON
+    binary = columnar_path(json_path)
+    return binary.exists() and binary.stat().st_mtime >= json_path.stat().st_mtime
+
+
+def _build_columnar(json_path: Path):
+    # Processes loading side by side may all find the copy missing and build
+    # it at once, each in its own part file. A copy another process published
+    # in the meantime counts as success, even if this one could not replace it
+    # (some platforms refuse while another process has the file mapped)
+    try:
+        convert_leaderboard(json_path)
+    except OSError:
+        if not columnar_fresh(json_path):
+            raise
+
+
+def load_leaderboard(json_path: Path, mode: Optional[str] = None):
+    mode = mode or load_mode
+    binary = columnar_path(json_path)
+    fresh = columnar_fresh(json_path)
+    if mode == "mmap":
+        if not fresh:
+            _build_columnar(json_path)
+        return map_columnar(binary)
+    lb_type = json_path.stem.rsplit("_", 1)[0]
+    if mode == "columnar" and fresh:
+        if compact_frames:
+            return compact_frame(feather.read_table(binary), lb_type)
+        return read_columnar(binary)
+    if compact_frames:
+        return compact_frame(_arrow_table(decode_json(json_path.read_bytes())), lb_type)
+    return read_json(json_path)
+
+
+def _timed_load(json_path: Path, mode: str):
+    with profiling.span(json_path.stem.rsplit("_", 1)[0], "load") as record:
+        start = time.perf_counter()
+        df = load_leaderboard(json_path, mode)
+        seconds = time.perf_counter() - start
+        record.update(mode=mode, bytes_in=json_path.stat().st_size, rows_out=len(df))
+    return df, seconds
+
+
+def load_datasets(
+    path: Path = dataset_path,
+    suffix: str = "full",
+    mode: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    executor: str = "thread",
+    timings: Optional[dict] = None,
+):
+    # Read and decode the leaderboards concurrently, so a cold start is bound by
+    # the largest file rather than the sum of all of them. executor="process"
+    # sidesteps the GIL for JSON decoding on multi-core machines; mmap frames
+    # always load on threads because pickling them would copy the mapping.
+    # Per-file load times are printed and, if given, stored in `timings`
+    mode = mode or load_mode
+    files = sorted(Path(path).glob(f"*_{suffix}.json"))
+    if executor == "process" and mode != "mmap":
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    with pool:
+        results = list(pool.map(_timed_load, files, [mode] * len(files)))
+
+    dfs = {}
+    for file, (df, seconds) in zip(files, results):
+        key = file.name.removesuffix(f"_{suffix}.json")
+        dfs[key] = df
+        if timings is not None:
+            timings[key] = seconds
+        print(f"Loaded {key} with {len(df)} records in {seconds * 1000:.0f} ms")
+    return dfs
+
+
+def key_lock(*key):
+    # One lock per key, so threads looking up the same lazily built value (such
+    # as report sections running on a thread pool) build it only once
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+class LazyDatasets(Mapping):
+    # Drop-in for the load_datasets() dict that only reads a leaderboard the
+    # first time it is looked up and keeps the frame afterwards. Membership and
+    # iteration only look at which files exist
+    def __init__(
+        self,
+        path: Path = dataset_path,
+        suffix: str = "full",
+        mode: Optional[str] = None,
+    ):
+        self.mode = mode or load_mode
+        self.files = {
+            file.name.removesuffix(f"_{suffix}.json"): file
+            for file in sorted(Path(path).glob(f"*_{suffix}.json"))
+        }
+        self.frames = {}
+        self.timings = {}
+
+    def __getitem__(self, key: str):
+        if key not in self.frames:
+            with key_lock(id(self), key):
+                if key not in self.frames:
+                    df, seconds = _timed_load(self.files[key], self.mode)
+                    self.timings[key] = seconds
+                    self.frames[key] = df
+                    # One write, so lines from concurrent loads don't interleave
+                    sys.stdout.write(
+                        f"Loaded {key} with {len(df)} records in {seconds * 1000:.0f} ms\n"
+                    )
+        return self.frames[key]
+
+    def __contains__(self, key):
+        return key in self.files
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
+def is_project_leaderboard(df: pd.DataFrame):
+    # The people/organization leaderboards have no usable slug
+    return df["slug"].is_unique and (df["slug"] != "").all()
+
+
+def _project_group(df: pd.DataFrame):
+    # `position` records each project's row in its source leaderboard
+    group = df.drop(columns=["leaderboardType"]).set_index("slug")
+    group["position"] = range(len(group))
+    return group
+
+
+class LazyProjectTable(Mapping):
+    # The "Project 360" view: one frame per project leaderboard, indexed by
+    # project slug, e.g. projects["commit-activity"]["value"]. Each leaderboard
+    # is only loaded and indexed when select_projects() first asks for it
+    def __init__(self, dfs: Mapping):
+        self.dfs = dfs
+        self.groups = {}
+
+    def __getitem__(self, key: str):
+        if key not in self.groups:
+            with key_lock(id(self), key):
+                if key not in self.groups:
+                    if not is_project_leaderboard(self.dfs[key]):
+                        raise KeyError(f"{key} is not a project leaderboard")
+                    self.groups[key] = _project_group(self.dfs[key])
+        return self.groups[key]
+
+    def __contains__(self, key):
+        return key in self.dfs
+
+    def __iter__(self):
+        return iter(self.dfs)
+
+    def __len__(self):
+        return len(self.dfs)
+
+
+def select_projects(projects, *groups: tuple[str, dict]):
+    # Flat frame of the projects present in every (leaderboard, {field: column})
+    # group, ordered like the first leaderboard, with the fields renamed and
+    # their original dtypes. Equivalent to chaining
+    # pd.merge(..., on="slug", how="inner") over the source frames. `projects`
+    # is a LazyProjectTable
+    frames = [projects[key] for key, _ in groups]
+    slugs = frames[0].index
+    for frame in frames[1:]:
+        slugs = slugs.intersection(frame.index, sort=False)
+    slugs = frames[0].loc[slugs, "position"].sort_values().index
+    columns = {}
+    for frame, (key, fields) in zip(frames, groups):
+        for field, name in fields.items():
+            if field == "slug":
+                columns[name] = slugs.to_series()
+            else:
+                columns[name] = frame.loc[slugs, field]
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+
+def _object_bytes(column: pd.Series):
+    # Count each distinct object (and the strings inside shared tuples/lists)
+    # once, which is what the process actually holds
+    seen = set()
+    total = 0
+    for value in column:
+        items = value if isinstance(value, (list, tuple)) else ()
+        for obj in (value, *items):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += sys.getsizeof(obj)
+    return total + column.memory_usage(deep=False, index=False)
+
+
+def frame_bytes(df: pd.DataFrame):
+    total = df.index.memory_usage(deep=True)
+    for name in df.columns:
+        column = df[name]
+        if column.dtype == object:
+            total += _object_bytes(column)
+        else:
+            total += column.memory_usage(deep=True, index=False)
+    return total
+
+
+def memory_report(dfs: Mapping):
+    # Rows, columns and resident bytes of every frame in `dfs`
+    report = pd.DataFrame(
+        [
+            {
+                "leaderboard": key,
+                "rows": len(df),
+                "columns": df.shape[1],
+                "bytes": frame_bytes(df),
+            }
+            for key, df in dfs.items()
+        ]
+    ).set_index("leaderboard")
+    report["bytes_per_row"] = report["bytes"] // report["rows"].clip(lower=1)
+    return report
+
+
+def convert_leaderboard(json_path: Path):
+    write_columnar(decode_json(json_path.read_bytes()), columnar_path(json_path))
+
+
+def convert_datasets(path: Path = dataset_path, suffix: str = "full"):
+    # Write the columnar copy of every JSON leaderboard in `path`
+    for file in sorted(Path(path).glob(f"*_{suffix}.json")):
+        convert_leaderboard(file)
+        print(f"Converted {file.name} -> {columnar_path(file).name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the columnar copies of the JSON leaderboards"
+    )
+    parser.add_argument("--datasets", type=Path, default=dataset_path)
+    parser.add_argument("--suffix", default="full")
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="load the leaderboards and print their memory report instead",
+    )
+    args = parser.parse_args()
+    if args.memory:
+        report = memory_report(load_datasets(args.datasets, args.suffix))
+        print(report.to_string())
+        print(f"Total: {report['bytes'].sum() / 2**20:.1f} MiB")
+    else:
+        convert_datasets(args.datasets, args.suffix)
@@ -0,0 +1,373 @@
+import functools
+import hashlib
+import os
+import pickle
+import platform
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import atomic
+import loader
+import profiling
+from loader import select_projects
+
+# (metric, *input ids) -> (inputs, result); see memoized()
+_cache = {}
+
+# Metric tables are also pickled under cache_path, keyed by the content of the
+# leaderboard files they read and by code_version, so a restarted kernel or a
+# new run over unchanged datasets skips the pandas work. LFX_METRICS_CACHE=off
+# (or `analysis.py --no-cache`) disables it; the least recently used tables are
+# evicted beyond LFX_METRICS_CACHE_MB
+cache_path = Path(__file__).parent / ".cache" / "metrics"
+cache_enabled = os.environ.get("LFX_METRICS_CACHE", "on") != "off"
+cache_limit = int(os.environ.get("LFX_METRICS_CACHE_MB", "256")) * 2**20
+# Any change to the metric or loading code, or to the Python, pandas or pyarrow
+# version the tables were pickled with, invalidates every cached table
+code_version = hashlib.sha256(
+    Path(__file__).read_bytes()
+    + Path(loader.__file__).read_bytes()
+    + f"{platform.python_version()} {pd.__version__} {pa.__version__}".encode()
+).hexdigest()
+# (path, size, mtime) -> sha256 of the file
+_file_digests = {}
+
+# Keywords matched (as substrings) against a project's collections and name to
+# tell libraries from end-user applications; pass other lists to
+# classify_projects() to segment differently
+library_keywords = [
+    "library",
+    "sdk",
+    "framework",
+    "toolkit",
+    "plugin",
+    "module",
+    "api",
+    "standard",
+    "spec",
+    "protocol",
+    "connector",
+    "driver",
+]
+app_keywords = [
+    "platform",
+    "application",
+    "server",
+    "client",
+    "dashboard",
+    "system",
+    "database",
+    "service",
+    "desktop",
+    "mobile",
+    "app",
+]
+
+
+def momentum(commits: pd.Series, previous: pd.Series):
+    # Relative change in activity since the previous period; projects without
+    # previous activity get 0 rather than an infinite change
+    return ((commits - previous) / previous).where(previous > 0, 0.0)
+
+
+def churn_ratio(commits: pd.Series, net_line_change: pd.Series):
+    # Commits per line of net codebase change. With no net change the ratio
+    # would be infinite, so the commit count itself is used as the score
+    return (commits / net_line_change).where(net_line_change > 0, commits)
+
+
+def _matches_any(text: pa.ChunkedArray, keywords: list[str]):
+    # One alternation per keyword set, evaluated over the whole column in Arrow
+    pattern = "|".join(re.escape(keyword) for keyword in keywords)
+    return pc.match_substring_regex(text, pattern).to_numpy(zero_copy_only=False)
+
+
+def classify_projects(
+    names: pd.Series,
+    collections: pd.Series,
+    library_keywords: list[str] = library_keywords,
+    app_keywords: list[str] = app_keywords,
+):
+    # Label every project "Library/Tool", "End-User App", "Hybrid/Platform"
+    # (e.g. a platform that also has an SDK) or "Unclassified" from the keywords
+    # in its lowercased collection slugs and name
+    slugs = pc.binary_join(pa.array(collections, type=pa.list_(pa.string())), " ")
+    text = pc.utf8_lower(
+        pc.binary_join_element_wise(
+            pc.fill_null(slugs, ""), pa.array(names, type=pa.string()), " "
+        )
+    )
+    is_lib = _matches_any(text, library_keywords)
+    is_app = _matches_any(text, app_keywords)
+    labels = np.select(
+        [is_lib & ~is_app, is_app & ~is_lib, is_lib & is_app],
+        ["Library/Tool", "End-User App", "Hybrid/Platform"],
+        default="Unclassified",
+    )
+    return pd.Series(labels, index=names.index, dtype=object)
+
+
+def file_digest(path: Path):
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        _file_digests[key] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return _file_digests[key]
+
+
+def _content_key(name: str, source, inputs: tuple[str, ...]):
+    # Only LazyDatasets (or a LazyProjectTable over one) know which files their
+    # frames come from; anything else is computed without the disk cache
+    datasets = getattr(source, "dfs", source)
+    files = getattr(datasets, "files", None)
+    if files is None or not all(key in files for key in inputs):
+        return None
+    digest = hashlib.sha256()
+    for part in (name, code_version, datasets.mode, str(loader.compact_frames)):
+        digest.update(part.encode() + b"\0")
+    for key in inputs:
+        digest.update(f"{key}={file_digest(files[key])}".encode() + b"\0")
+    return digest.hexdigest()
+
+
+def _evict(root: Path, limit: int):
+    entries = sorted(root.glob("*.pkl"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in entries)
+    for entry in entries:
+        if total <= limit:
+            break
+        total -= entry.stat().st_size
+        entry.unlink(missing_ok=True)
+
+
+def _read_entry(path):
+    # The cached result wrapped in a tuple, or None on a miss. A truncated or
+    # unreadable entry, or one another library version can't unpickle
+    # (AttributeError, ImportError, TypeError, ...), is a miss too and gets
+    # recomputed and overwritten
+    try:
+        with open(path, "rb") as f:
+            return (pickle.load(f),)
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def _load_or_compute(function, source, inputs: tuple[str, ...]):
+    key = _content_key(function.__name__, source, inputs) if cache_enabled else None
+    if key is None:
+        return function(source)
+    path = cache_path / f"{function.__name__}-{key}.pkl"
+    cached = _read_entry(path)
+    if cached is not None:
+        os.utime(path)
+        return cached[0]
+
+    result = function(source)
+    os.makedirs(cache_path, exist_ok=True)
+    with atomic.replacing(path) as part, open(part, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _evict(cache_path, cache_limit)
+    return result
+
+
+def _input_rows(source, inputs: tuple[str, ...]):
+    # Rows of the input leaderboards that are loaded; none are after a disk
+    # cache hit on lazily loaded datasets
+    datasets = getattr(source, "dfs", source)
+    frames = getattr(datasets, "frames", datasets)
+    return sum(len(frames[key]) for key in inputs if key in frames)
+
+
+def memoized(*inputs: str):
+    # Compute a metric once per process for the same input (the Project 360
+    # table or dfs), so the notebook sections and the report share one
+    # result, and reuse it across processes through the disk cache. `inputs`
+    # names the leaderboards the metric reads. The input is kept alive in the
+    # cache entry, which keeps its id unique while it lives. Concurrent calls
+    # (report sections on a thread pool) compute it once. Callers must copy a
+    # result before modifying it
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(source):
+            key = (function.__name__, id(source))
+            if key not in _cache:
+                with loader.key_lock(*key):
+                    if key not in _cache:
+                        with profiling.span(function.__name__, "metric") as record:
+                            result = _load_or_compute(function, source, inputs)
+                            if profiling.enabled:
+                                record["rows_in"] = _input_rows(source, inputs)
+                                record["rows_out"] = profiling.rows(result)
+                        _cache[key] = (source, result)
+            return _cache[key][1]
+
+        return wrapper
+
+    return decorate
+
+
+def clear_cache():
+    _cache.clear()
+
+
+@memoized("active-contributors", "commit-activity")
+def efficiency(projects):
+    # Section 2: commits per active contributor
+    df = select_projects(
+        projects,
+        (
+            "active-contributors",
+            {"name": "name", "slug": "slug", "value": "active_contributors"},
+        ),
+        ("commit-activity", {"value": "commits"}),
+    )
+    df["commits_per_contributor"] = df["commits"] / df["active_contributors"]
+    return df
+
+
+@memoized("fastest-responders", "resolution-rate")
+def triage(projects):
+    # Section 3: first-response time (assuming hours or a similar unit) against
+    # resolution rate
+    return select_projects(
+        projects,
+        (
+            "fastest-responders",
+            {"name": "name", "slug": "slug", "value": "response_time_hours"},
+        ),
+        ("resolution-rate", {"value": "resolution_rate"}),
+    )
+
+
+@memoized("fastest-responders", "resolution-rate")
+def triage_correlation(projects):
+    df = triage(projects)
+    return df["response_time_hours"].corr(df["resolution_rate"])
+
+
+@memoized("codebase-size", "commit-activity")
+def growth(projects):
+    # Section 4: commits per line of code
+    df = select_projects(
+        projects,
+        ("codebase-size", {"name": "name", "slug": "slug", "value": "codebase_size"}),
+        ("commit-activity", {"value": "commits"}),
+    )
+    df["maintenance_ratio"] = df["commits"] / df["codebase_size"]
+    return df
+
+
+@memoized("active-organizations", "active-contributors")
+def org_diversity(projects):
+    # Section 5: active organizations per active contributor
+    df = select_projects(
+        projects,
+        (
+            "active-organizations",
+            {"name": "name", "slug": "slug", "value": "active_organizations"},
+        ),
+        ("active-contributors", {"value": "active_contributors"}),
+    )
+    df["org_diversity_ratio"] = df["active_organizations"] / df["active_contributors"]
+    return df
+
+
+@memoized("active-organizations", "active-contributors")
+def hidden_gems(projects):
+    # Projects with a decent number of contributors, to avoid noise
+    df = org_diversity(projects)
+    return df[df["active_contributors"] > 50]
+
+
+@memoized("small-teams-massive-output")
+def bus_factor(dfs):
+    # Section 6: the small-teams-massive-output leaderboard (<= 50 contributors)
+    return dfs["small-teams-massive-output"][
+        ["name", "slug", "value", "collectionsSlugs"]
+    ].rename(columns={"value": "commits"})
+
+
+@memoized("focused-teams", "commit-activity")
+def burnout(projects):
+    # Section 7: productivity score against the change in commit activity
+    df = select_projects(
+        projects,
+        (
+            "focused-teams",
+            {"name": "name", "slug": "slug", "value": "productivity_score"},
+        ),
+        (
+            "commit-activity",
+            {"value": "commits", "previousPeriodValue": "prev_commits"},
+        ),
+    )
+    df["momentum"] = momentum(df["commits"], df["prev_commits"])
+    return df
+
+
+@memoized("focused-teams", "commit-activity")
+def declining_projects(projects):
+    # Projects slowing down by more than 10% with significant activity
+    df = burnout(projects)
+    return df[(df["momentum"] < -0.1) & (df["commits"] > 100)]
+
+
+@memoized("active-organizations", "active-contributors")
+def segmentation(projects):
+    # Section 8: organization diversity with a library/app label
+    df = select_projects(
+        projects,
+        (
+            "active-organizations",
+            {
+                "name": "name",
+                "slug": "slug",
+                "value": "active_organizations",
+                "collectionsSlugs": "collectionsSlugs",
+            },
+        ),
+        ("active-contributors", {"value": "active_contributors"}),
+    )
+    df["org_diversity_ratio"] = df["active_organizations"] / df["active_contributors"]
+    df["type"] = classify_projects(df["name"], df["collectionsSlugs"])
+    return df
+
+
+@memoized("active-organizations", "active-contributors")
+def segmented_gems(projects):
+    # High diversity ratio (> 0.5) and a reasonable organization count (> 5)
+    df = segmentation(projects)
+    return df[(df["org_diversity_ratio"] > 0.5) & (df["active_organizations"] > 5)]
+
+
+@memoized("codebase-size", "commit-activity")
+def churn(projects):
+    # Section 9: commits per line of net codebase change
+    df = select_projects(
+        projects,
+        (
+            "codebase-size",
+            {
+                "name": "name",
+                "slug": "slug",
+                "value": "current_loc",
+                "previousPeriodValue": "prev_loc",
+            },
+        ),
+        ("commit-activity", {"value": "commits"}),
+    )
+    df["net_line_change"] = (df["current_loc"] - df["prev_loc"]).abs()
+    df["churn_ratio_proxy"] = churn_ratio(df["commits"], df["net_line_change"])
+    return df
+
+
+@memoized("codebase-size", "commit-activity")
+def active_churn(projects):
+    # Projects with significant activity (> 100 commits)
+    df = churn(projects)
+    return df[df["commits"] > 100]
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import atomic
+
+# Pipeline instrumentation. While enabled (LFX_TRACE=<file>, LFX_TRACE=1 for
+# .cache/trace.json, `--trace` or enable()), every span() records its wall and
+# CPU time, the rows it read and produced and the peak memory allocated while
+# it ran. Memory is tracked with tracemalloc, which slows the run down, and is
+# process-wide: spans running concurrently on threads see each other's
+# allocations. write_trace() saves the spans in the Chrome trace event format
+# (open it in https://ui.perfetto.dev or chrome://tracing) and summary()
+# totals them per span name
+default_trace_path = Path(__file__).parent / ".cache" / "trace.json"
+enabled = False
+trace_path: Optional[Path] = None
+events = []
+_origin = time.perf_counter()
+_local = threading.local()
+
+
+def enable(path: Optional[Path] = None):
+    global enabled, trace_path
+    enabled = True
+    trace_path = Path(path) if path else default_trace_path
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def rows(value):
+    # Row count of a frame or series, None for anything else
+    return len(value) if hasattr(value, "shape") and value.shape else None
+
+
+@contextmanager
+def span(name: str, category: str):
+    # Yields a dict for the caller to fill with rows_in, rows_out or any other
+    # figure worth recording with the span
+    record = {}
+    if not enabled:
+        yield record
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # reset_peak() below would lose the enclosing span's peak so far
+        stack[-1] = max(stack[-1], peak)
+    tracemalloc.reset_peak()
+    stack.append(current)
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        wall, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+        peak = max(stack.pop(), tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1] = max(stack[-1], peak)
+        events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - _origin) * 1e6),
+                "dur": round(wall * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {
+                    "cpu_ms": round(cpu * 1000, 3),
+                    "peak_kib": round((peak - current) / 1024, 1),
+                    **{
+                        key: value for key, value in record.items() if value is not None
+                    },
+                },
+            }
+        )
+
+
+def clock_origin():
+    # What a worker process needs to record spans into this trace with
+    # collect(), or None while instrumentation is disabled
+    return _origin if enabled else None
+
+
+@contextmanager
+def collect(origin: Optional[float]):
+    # For code running in a worker process, which has its own list of events:
+    # with the parent's clock_origin(), spans are recorded on the parent's
+    # clock and the ones recorded inside the block are moved into the yielded
+    # list, for the worker to hand back to the parent to add to its events
+    global _origin
+    spans = []
+    if origin is None:
+        yield spans
+        return
+    _origin = origin
+    if not enabled:
+        enable()
+    start = len(events)
+    try:
+        yield spans
+    finally:
+        spans.extend(events[start:])
+        del events[start:]
+
+
+def summary():
+    # {category: {name: totals}} with the calls, wall and CPU milliseconds, the
+    # largest peak and the rows in and out of the spans of each name
+    totals = {}
+    for event in events:
+        total = totals.setdefault(event["cat"], {}).setdefault(
+            event["name"], {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0}
+        )
+        args = event["args"]
+        total["calls"] += 1
+        total["wall_ms"] = round(total["wall_ms"] + event["dur"] / 1000, 3)
+        total["cpu_ms"] = round(total["cpu_ms"] + args["cpu_ms"], 3)
+        total["peak_kib"] = max(total.get("peak_kib", 0.0), args["peak_kib"])
+        for field in ("rows_in", "rows_out"):
+            if args.get(field) is not None:
+                total[field] = total.get(field, 0) + args[field]
+    return totals
+
+
+def write_trace(path: Optional[Path] = None):
+    path = Path(path or trace_path or default_trace_path)
+    os.makedirs(path.parent, exist_ok=True)
+    atomic.write_json(path, {"traceEvents": events, "displayTimeUnit": "ms"})
+    print(f"Wrote {len(events)} trace spans to {path}")
+
+
+_setting = os.environ.get("LFX_TRACE", "")
+if _setting not in ("", "0", "off"):
+    enable(None if _setting == "1" else Path(_setting))
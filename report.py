@@ -0,0 +1,678 @@
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+import atomic
+import metrics
+import profiling
+from loader import LazyDatasets, LazyProjectTable, dataset_path
+
+try:
+    import brotli
+except ImportError:  # optional; shards are then only precompressed with gzip
+    brotli = None
+
+report_path = Path(__file__).parent / "datastory" / "report_data.json"
+# Sections are recomputed when this file or the metric code changes
+code_version = hashlib.sha256(
+    Path(__file__).read_bytes() + metrics.code_version.encode()
+).hexdigest()
+
+# Columnar report encoding (encoding="columnar"): every list of records becomes
+# {"columnar": 1, "length": n, "columns": {field: values}}. Floats keep
+# float_digits significant digits unless field_precision says otherwise, and
+# repetitive string columns and string-list columns are dictionary-encoded as
+# {"dict": [...], "codes": [...]} and {"dict": [...], "lists": [[...], ...]}.
+# datastory/report-columnar.js decodes it back into records
+float_digits = 4
+field_precision = {
+    "momentum": 3,
+    "maintenance_ratio": 3,
+}
+
+# name -> (function, leaderboards it reads), in report order
+sections = {}
+
+
+def section(*inputs: str):
+    # Register a report section. It runs only when all of `inputs` are present
+    # and returns the report keys it owns
+    def register(function):
+        sections[function.__name__] = (function, inputs)
+        return function
+
+    return register
+
+
+@section("active-contributors", "commit-activity")
+def efficiency(dfs, projects):
+    # Section 2: David vs. Goliath
+    merged_df = metrics.efficiency(projects)
+    return {
+        "efficiency": merged_df.nlargest(50, "commits_per_contributor"),
+        "efficiency_all": merged_df,
+    }
+
+
+@section("fastest-responders", "resolution-rate")
+def triage(dfs, projects):
+    # Section 3: The "Triage Trap"
+    return {
+        "response_resolution": metrics.triage(projects),
+        "correlation": float(metrics.triage_correlation(projects)),
+    }
+
+
+@section("codebase-size", "commit-activity")
+def growth(dfs, projects):
+    # Section 4: Growth vs. Maintenance
+    merged_cs_ca = metrics.growth(projects)
+    return {
+        "growth_maintenance": merged_cs_ca,
+        "top_maintenance": merged_cs_ca.nlargest(15, "maintenance_ratio"),
+    }
+
+
+@section("active-organizations", "active-contributors")
+def hidden_gems(dfs, projects):
+    # Section 5: Finding "Hidden Gems"
+    filtered_org_cont = metrics.hidden_gems(projects)
+    return {
+        "hidden_gems": filtered_org_cont.nlargest(20, "org_diversity_ratio"),
+        "org_diversity_all": filtered_org_cont,
+    }
+
+
+@section("small-teams-massive-output")
+def bus_factor(dfs, projects):
+    # Section 6: Small Teams, Massive Output
+    return {"bus_factor": metrics.bus_factor(dfs).nlargest(20, "commits")}
+
+
+@section("focused-teams", "commit-activity")
+def burnout(dfs, projects):
+    # Section 7: The "Red Alert" List
+    return {
+        "burnout_risk": metrics.declining_projects(projects).nsmallest(15, "momentum"),
+        "burnout_all": metrics.burnout(projects),
+    }
+
+
+@section("codebase-size", "commit-activity")
+def churn(dfs, projects):
+    # Section 9: The "Churn" Trap
+    churn_filtered = metrics.active_churn(projects)
+    return {
+        "churn_high": churn_filtered.nlargest(15, "churn_ratio_proxy"),
+        "churn_all": churn_filtered,
+    }
+
+
+@section("active-organizations", "active-contributors")
+def segmentation(dfs, projects):
+    # Section 8: Libraries vs. Apps. The shared frame keeps the lists for the
+    # notebook chart; export a copy of the top rows with them flattened to text
+    gems = metrics.segmented_gems(projects).nlargest(30, "org_diversity_ratio").copy()
+    gems["collectionsSlugs"] = gems["collectionsSlugs"].apply(
+        lambda x: ", ".join(x) if pd.api.types.is_list_like(x) else str(x)
+    )
+    return {"segmented_gems": gems}
+
+
+def _round_significant(value: float, digits: int):
+    if not math.isfinite(value) or value == 0:
+        return value
+    return float(f"{value:.{digits}g}")
+
+
+def _encode_column(field: str, values: list):
+    if values and all(
+        isinstance(v, (list, tuple)) and all(isinstance(s, str) for s in v)
+        for v in values
+    ):
+        strings = {
+            s: i for i, s in enumerate(dict.fromkeys(s for v in values for s in v))
+        }
+        return {
+            "dict": list(strings),
+            "lists": [[strings[s] for s in v] for v in values],
+        }
+    if values and all(isinstance(v, str) for v in values):
+        strings = {s: i for i, s in enumerate(dict.fromkeys(values))}
+        if len(strings) * 2 <= len(values):
+            return {"dict": list(strings), "codes": [strings[v] for v in values]}
+        return values
+    digits = field_precision.get(field, float_digits)
+    return [
+        _round_significant(v, digits) if isinstance(v, float) else v for v in values
+    ]
+
+
+def encode_columnar(value):
+    # Lists of records are encoded column by column; anything else (such as
+    # the correlation scalar) is kept as it is
+    if not (value and isinstance(value, list) and isinstance(value[0], dict)):
+        return value
+    fields = list(dict.fromkeys(field for record in value for field in record))
+    return {
+        "columnar": 1,
+        "length": len(value),
+        "columns": {
+            field: _encode_column(field, [record.get(field) for record in value])
+            for field in fields
+        },
+    }
+
+
+def _state_path(path: Path):
+    return path.with_name(f".{path.stem}.state.json")
+
+
+def _section_fingerprint(dfs, inputs: tuple[str, ...]):
+    # None when the inputs cannot be traced back to files, which forces a
+    # rebuild of the section
+    files = getattr(dfs, "files", None)
+    if files is None:
+        return None
+    return {
+        key: metrics.file_digest(files[key]) if key in files else None for key in inputs
+    }
+
+
+def shard_path(path: Path):
+    # datastory/report_data.json -> datastory/report_data/
+    return path.with_suffix("")
+
+
+def _shard_files(entry: dict):
+    return [entry["file"]] + [
+        entry[kind]["file"] for kind in ("gzip", "br") if kind in entry
+    ]
+
+
+class ShardWriter:
+    # One JSON file per report key, with precompressed .gz (and .br when brotli
+    # is installed) copies and a manifest.json of their sizes and hashes, so a
+    # page can fetch just the keys it renders. Keys are added one at a time as
+    # they are serialized. Shards whose content is unchanged are not
+    # rewritten, and close() deletes the shards of the previous manifest whose
+    # keys were not added. No other file is ever deleted, and a non-empty
+    # directory without a manifest is refused rather than written into
+    def __init__(self, root: Path):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        manifest = root / "manifest.json"
+        if not manifest.exists() and any(root.iterdir()):
+            raise FileExistsError(
+                f"{root} is not empty and has no manifest.json; refusing to "
+                "write report shards into it"
+            )
+        try:
+            self.previous = json.loads(manifest.read_text())["keys"]
+        except (OSError, ValueError, KeyError):
+            self.previous = {}
+        self.manifest = {}
+
+    def keep(self, key: str, digest: str):
+        # Keep the previous shard of `key` if its content has the sha256
+        # `digest`; returns whether it was kept
+        old = self.previous.get(key)
+        if (
+            old is not None
+            and old["sha256"] == digest
+            and ("br" in old) == (brotli is not None)
+            and all((self.root / name).exists() for name in _shard_files(old))
+        ):
+            self.manifest[key] = old
+            return True
+        return False
+
+    def add(self, key: str, raw: bytes, digest: Optional[str] = None):
+        digest = digest or hashlib.sha256(raw).hexdigest()
+        if self.keep(key, digest):
+            return
+        entry = {"file": f"{key}.json", "bytes": len(raw), "sha256": digest}
+        atomic.write_bytes(self.root / entry["file"], raw)
+        compressed = {"gzip": (".gz", gzip.compress(raw, 9, mtime=0))}
+        if brotli is not None:
+            compressed["br"] = (".br", brotli.compress(raw, quality=11))
+        for kind, (suffix, data) in compressed.items():
+            entry[kind] = {"file": entry["file"] + suffix, "bytes": len(data)}
+            atomic.write_bytes(self.root / entry[kind]["file"], data)
+        self.manifest[key] = entry
+
+    def close(self):
+        keep = {
+            name for entry in self.manifest.values() for name in _shard_files(entry)
+        }
+        for entry in self.previous.values():
+            for name in _shard_files(entry):
+                if name not in keep:
+                    (self.root / name).unlink(missing_ok=True)
+        atomic.write_json(self.root / "manifest.json", {"keys": self.manifest})
+
+
+def serialize_value(value, encoding: str = "records", chunk_rows: int = 1000):
+    # The JSON of one report value, byte for byte as json.dump() writes it. A
+    # frame is turned into records chunk_rows at a time, so only one chunk of
+    # Python dicts is alive next to the encoded text
+    if not isinstance(value, pd.DataFrame):
+        return json.dumps(value).encode()
+    if encoding == "columnar":
+        return json.dumps(encode_columnar(value.to_dict(orient="records"))).encode()
+    parts = [b"["]
+    for start in range(0, len(value), chunk_rows):
+        records = value.iloc[start : start + chunk_rows].to_dict(orient="records")
+        if start:
+            parts.append(b", ")
+        parts.append(json.dumps(records)[1:-1].encode())
+    parts.append(b"]")
+    return b"".join(parts)
+
+
+def _read_range(file, start: int, end: int, chunk_size: int = 64 * 1024):
+    # Bytes start:end of `file`, chunk_size at a time
+    file.seek(start)
+    while start < end:
+        chunk = file.read(min(chunk_size, end - start))
+        if not chunk:
+            raise EOFError(f"{file.name} ended at byte {start}, expected {end}")
+        start += len(chunk)
+        yield chunk
+
+
+def _compute_section(name: str, dfs, projects, encoding: str):
+    # Run one section and serialize its values; module level so that a process
+    # pool can pickle it
+    function, _ = sections[name]
+    with profiling.span(name, "report section") as record:
+        data = function(dfs, projects)
+        record["rows_out"] = sum(profiling.rows(value) or 0 for value in data.values())
+        items = []
+        for key in list(data):
+            value = data.pop(key)
+            with profiling.span(key, "serialize") as serialized:
+                raw = serialize_value(value, encoding)
+                serialized.update(rows_in=profiling.rows(value), bytes_out=len(raw))
+            items.append((key, raw))
+    return items
+
+
+def _compute_section_traced(name: str, dfs, projects, encoding: str, origin):
+    # Process pool entry point: the spans the section records in the worker
+    # are returned with its items, to be merged into the parent's trace
+    with profiling.collect(origin) as spans:
+        items = _compute_section(name, dfs, projects, encoding)
+    return items, spans
+
+
+def run_sections(
+    names: list[str],
+    dfs,
+    projects,
+    encoding: str = "records",
+    max_workers: Optional[int] = None,
+    executor: str = "thread",
+):
+    # Compute and serialize the named sections on a worker pool and yield
+    # (name, [(key, json bytes)], None) for each, or (name, None, exception) for
+    # one that failed, in the order of `names` whatever order they finish in.
+    # Only max_workers sections are running or waiting to be written at a time,
+    # so memory stays bounded by a few sections. executor="process" sidesteps
+    # the GIL for the pandas and JSON work; it pickles dfs and projects for
+    # every section, so it pays off only with large sections. With one worker
+    # (the default on a single-core machine) or a pool that cannot be started,
+    # the sections run serially in the calling thread
+    workers = min(max_workers or os.cpu_count() or 1, len(names))
+    pool = None
+    if workers > 1:
+        try:
+            if executor == "process":
+                pool = ProcessPoolExecutor(max_workers=workers)
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError) as exc:
+            print(f"Running report sections serially ({exc})")
+    if pool is None:
+        for name in names:
+            # Any failure is handed to the caller, which re-raises it once the
+            # rest of the report is written
+            try:
+                yield name, _compute_section(name, dfs, projects, encoding), None
+            except Exception as exc:  # noqa: BLE001
+                yield name, None, exc
+        return
+
+    def submit(name: str):
+        if executor == "process":
+            return pool.submit(
+                _compute_section_traced,
+                name,
+                dfs,
+                projects,
+                encoding,
+                profiling.clock_origin(),
+            )
+        return pool.submit(_compute_section, name, dfs, projects, encoding)
+
+    with pool:
+        waiting = iter(names)
+        pending = deque()
+        for name in itertools.islice(waiting, workers):
+            pending.append((name, submit(name)))
+        while pending:
+            name, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+                if executor == "process":
+                    result, spans = result
+                    profiling.events.extend(spans)
+            except Exception as exc:  # noqa: BLE001
+                result, error = None, exc
+            for following in itertools.islice(waiting, 1):
+                pending.append((following, submit(following)))
+            yield name, result, error
+
+
+def update_report(
+    path: Path,
+    dfs,
+    projects,
+    names: Optional[list[str]] = None,
+    force: bool = False,
+    shards: bool = True,
+    encoding: str = "records",
+    max_workers: Optional[int] = None,
+    executor: str = "thread",
+    trace_summary: bool = False,
+):
+    # Recompute only the sections whose leaderboards (or code) changed since
+    # the report at `path` was written and splice them into it. The inputs and
+    # keys of every section are recorded in a sidecar state file. Sections not
+    # in `names` are carried over untouched (or recomputed, when there is no
+    # state that describes the report, and refused if they can't be); `force`
+    # recomputes the others even if their inputs are unchanged. With `shards`,
+    # the per-key files are refreshed as well (see ShardWriter).
+    # encoding="columnar" writes the columnar encoding described above instead
+    # of lists of records.
+    #
+    # The report is streamed to disk: each value is serialized straight from
+    # its frame (see serialize_value), written to the report and its shard, and
+    # released, and unchanged values are copied from the previous report a
+    # chunk at a time, from the byte ranges the state file records for every
+    # value. Their shards are kept if the recorded sha256 matches; otherwise
+    # the value is read whole to rewrite its shard. The sections to recompute
+    # run concurrently (see run_sections), but are written in report order. A
+    # section that fails keeps its previous values and is retried on the next
+    # run; once the rest of the report is written, the failures are raised
+    # together as an ExceptionGroup. With `trace_summary` and instrumentation
+    # enabled, profiling.summary() is added to the report under "metadata" (not
+    # as a shard). Returns the keys written
+    path = Path(path)
+    state_file = _state_path(path)
+    try:
+        state = json.loads(state_file.read_text())
+        with open(path, "rb") as f:
+            report_sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+    except (OSError, ValueError):
+        state, report_sha256 = {}, None
+    # A report replaced or edited since the state was written (a checkout or a
+    # copy) is not the one the state describes, so everything is recomputed
+    if (state.get("code_version"), state.get("encoding"), state.get("sha256")) != (
+        code_version,
+        encoding,
+        report_sha256,
+    ):
+        state = {}
+    # key -> {"start", "end", "sha256"} of every value in the report
+    previous = state.get("values", {})
+
+    # name -> (old state entry, fingerprint, whether to recompute)
+    plan = {}
+    # Sections left out of `names` that are recomputed anyway, or can't be
+    unrecorded, lost = [], []
+    for name, (_, inputs) in sections.items():
+        old = state.get("sections", {}).get(name)
+        if old is not None and not all(key in previous for key in old["keys"]):
+            old = None
+        if names is not None and name not in names:
+            if old is not None:
+                plan[name] = (old, old["inputs"], False)
+                continue
+            # Without a state describing the report, the values of a section
+            # can't be told apart in it, so it is recomputed rather than
+            # dropped from the report
+            if state:
+                continue
+            if not all(key in dfs for key in inputs):
+                if path.exists():
+                    lost.append(name)
+                continue
+            unrecorded.append(name)
+        fingerprint = _section_fingerprint(dfs, inputs)
+        if (
+            not force
+            and fingerprint is not None
+            and old is not None
+            and old["inputs"] == fingerprint
+        ):
+            plan[name] = (old, fingerprint, False)
+        elif all(key in dfs for key in inputs):
+            plan[name] = (old, fingerprint, True)
+        else:
+            plan[name] = ({"keys": []}, fingerprint, False)
+    if lost:
+        raise RuntimeError(
+            f"{path} has no state file describing it, so the sections left out "
+            f"({', '.join(lost)}) would have to be recomputed to keep them, but "
+            "their leaderboards are missing"
+        )
+    if unrecorded:
+        print(
+            f"No state file describes {path}; also recomputing the sections "
+            f"left out: {', '.join(unrecorded)}"
+        )
+    results = run_sections(
+        [name for name, (_, _, compute) in plan.items() if compute],
+        dfs,
+        projects,
+        encoding,
+        max_workers,
+        executor,
+    )
+
+    os.makedirs(path.parent, exist_ok=True)
+    shard_writer = ShardWriter(shard_path(path)) if shards else None
+    keys = []
+    values = {}
+    owned = {}
+    recomputed = []
+    errors = []
+    digest = hashlib.sha256()
+    with (
+        atomic.replacing(path) as part,
+        open(part, "wb") as out,
+        open(path if previous else os.devnull, "rb") as old_file,
+    ):
+
+        def write(key: str, chunks):
+            prefix = ((", " if out.tell() else "{") + json.dumps(key) + ": ").encode()
+            out.write(prefix)
+            digest.update(prefix)
+            start = out.tell()
+            value_digest = hashlib.sha256()
+            for chunk in chunks:
+                out.write(chunk)
+                digest.update(chunk)
+                value_digest.update(chunk)
+            values[key] = {
+                "start": start,
+                "end": out.tell(),
+                "sha256": value_digest.hexdigest(),
+            }
+
+        def emit(key: str, raw: bytes):
+            with profiling.span(key, "write") as record:
+                record["bytes_out"] = len(raw)
+                write(key, [raw])
+                if shard_writer is not None:
+                    shard_writer.add(key, raw, values[key]["sha256"])
+            keys.append(key)
+
+        def carry(key: str):
+            old = previous[key]
+            if shard_writer is not None and not shard_writer.keep(key, old["sha256"]):
+                old_file.seek(old["start"])
+                emit(key, old_file.read(old["end"] - old["start"]))
+                return
+            with profiling.span(key, "write") as record:
+                record["bytes_out"] = old["end"] - old["start"]
+                write(key, _read_range(old_file, old["start"], old["end"]))
+            keys.append(key)
+
+        for name, (old, fingerprint, compute) in plan.items():
+            if compute:
+                _, items, error = next(results)
+                if error is None:
+                    for key, raw in items:
+                        emit(key, raw)
+                    owned[name] = {"inputs": fingerprint, "keys": [k for k, _ in items]}
+                    recomputed.append(name)
+                    continue
+                error.add_note(f"in report section {name!r}")
+                errors.append(error)
+                if old is None:
+                    continue
+            for key in old["keys"]:
+                carry(key)
+            owned[name] = {
+                "inputs": old.get("inputs", fingerprint),
+                "keys": old["keys"],
+            }
+        if trace_summary and profiling.enabled:
+            write("metadata", [json.dumps({"trace": profiling.summary()}).encode()])
+        closing = b"}" if out.tell() else b"{}"
+        out.write(closing)
+        digest.update(closing)
+
+    atomic.write_json(
+        state_file,
+        {
+            "code_version": code_version,
+            "encoding": encoding,
+            "sha256": digest.hexdigest(),
+            "sections": owned,
+            "values": values,
+        },
+    )
+    if shard_writer is not None:
+        shard_writer.close()
+    print(f"Recomputed report sections: {', '.join(recomputed) or 'none'}")
+    if errors:
+        raise ExceptionGroup(f"{len(errors)} report section(s) failed", errors)
+    return keys
+
+
+if __name__ == "__main__":
+    # Headless export: only the loader and metric pipeline are imported, not
+    # marimo, altair or the notebook's chart cells
+    parser = argparse.ArgumentParser(
+        description="Write the data story report without running the notebook"
+    )
+    parser.add_argument("--datasets", type=Path, default=dataset_path)
+    parser.add_argument("--output", type=Path, default=report_path)
+    parser.add_argument(
+        "--sections",
+        help=f"comma-separated sections to regenerate ({', '.join(sections)}); "
+        "the others are kept from the existing report",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="recompute the sections even if their leaderboards are unchanged",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the metric table cache"
+    )
+    parser.add_argument(
+        "--encoding",
+        choices=["records", "columnar"],
+        default="records",
+        help="columnar: per-field columns with rounded floats and dictionary-"
+        "encoded strings (decode with datastory/report-columnar.js)",
+    )
+    parser.add_argument(
+        "--no-shards",
+        action="store_true",
+        help="only write the single report file, not the per-key shards",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="sections computed concurrently (default: one per CPU; 1 runs "
+        "them serially)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="process: compute the sections in worker processes",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        nargs="?",
+        const=profiling.default_trace_path,
+        help="record the time, rows and peak memory of every load, metric and "
+        "section in a Chrome trace file (default: "
+        f"{profiling.default_trace_path.relative_to(Path(__file__).parent)})",
+    )
+    parser.add_argument(
+        "--trace-summary",
+        action="store_true",
+        help="also add the per-span totals to the report under metadata "
+        "(implies --trace)",
+    )
+    args = parser.parse_args()
+
+    names = args.sections.split(",") if args.sections else None
+    unknown = set(names or ()) - set(sections)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    if args.no_cache:
+        metrics.cache_enabled = False
+    if args.trace or args.trace_summary:
+        profiling.enable(args.trace)
+
+    start = time.perf_counter()
+    dfs = LazyDatasets(args.datasets)
+    with profiling.span("export", "report"):
+        keys = update_report(
+            args.output,
+            dfs,
+            LazyProjectTable(dfs),
+            names,
+            args.force,
+            not args.no_shards,
+            args.encoding,
+            args.workers,
+            args.executor,
+            args.trace_summary,
+        )
+    print(
+        f"Exported {len(keys)} datasets to {args.output} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    if profiling.enabled:
+        profiling.write_trace()
@@ -1,33 +1,200 @@
+import argparse
+import codecs
+import hashlib
 import json
+import math
 import os
+import re
+import shutil
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-ranked_api_link = "https://insights.linuxfoundation.org/api/leaderboard?maxRank={0}"
-paged_api_link = (
-    "https://insights.linuxfoundation.org/api/leaderboard?page=0&pageSize={0}"
-)
+import atomic
+import loader
+import snapshots
+
+# Override to point the scraper at a mirror or a local stand-in server
+api_base = os.environ.get("LFX_API_BASE", "https://insights.linuxfoundation.org/api")
+ranked_api_link = api_base + "/leaderboard?maxRank={0}"
+paged_api_link = api_base + "/leaderboard?page={1}&pageSize={0}"
 dataset_path = Path(__file__).parent / "datasets"
+stream_chunk_size = 64 * 1024
+# Raw responses keyed by URL, revalidated with ETag/Last-Modified on later runs.
+# "refresh" sends conditional requests, "offline" replays the cache without
+# touching the network and "off" disables it
+cache_path = Path(__file__).parent / ".cache" / "http"
+cache_mode = os.environ.get("LFX_HTTP_CACHE", "refresh")
+# Pages of a resumable scrape are checkpointed here; it sits inside datasets/ so
+# the finished files can be moved into place with an atomic rename. Staged pages
+# older than LFX_STAGING_MAX_AGE_HOURS are discarded rather than resumed, since
+# pages fetched from different rankings would not add up to one leaderboard
+staging_path = dataset_path / ".staging"
+staging_max_age = float(os.environ.get("LFX_STAGING_MAX_AGE_HOURS", "6")) * 3600
 
 os.makedirs(dataset_path, exist_ok=True)
 
 
-def get_total_entries():
-    response = requests.get(paged_api_link.format(1))
-    response.raise_for_status()
-    data = response.json()
+def make_session(pool_size: int = 8, retries: int = 3):
+    # One pooled session shared by all page workers, retrying transient failures
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _cache_files(url: str):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return cache_path / f"{key}.json", cache_path / f"{key}.meta.json"
+
+
+def _conditional_headers(url: str):
+    body_file, meta_file = _cache_files(url)
+    if cache_mode != "refresh" or not (body_file.exists() and meta_file.exists()):
+        return {}
+    meta = json.loads(meta_file.read_text())
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _read_chunks(path: Path):
+    with open(path, "rb") as f:
+        while chunk := f.read(stream_chunk_size):
+            yield chunk
+
+
+def _tee_to_cache(url: str, response: requests.Response):
+    # Pass the body through while writing it to the cache, and only publish the
+    # cache entry once the whole body has been received
+    body_file, meta_file = _cache_files(url)
+    os.makedirs(cache_path, exist_ok=True)
+    with atomic.replacing(body_file) as part, open(part, "wb") as f:
+        for chunk in response.iter_content(stream_chunk_size):
+            f.write(chunk)
+            yield chunk
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    atomic.write_json(meta_file, meta)
+
+
+@contextmanager
+def open_url(url: str, session: Optional[requests.Session] = None):
+    # Yields (byte chunks, changed). changed is False when the server answered
+    # 304 and the chunks are replayed from the cache
+    body_file, _ = _cache_files(url)
+    if cache_mode == "offline":
+        if not body_file.exists():
+            raise FileNotFoundError(f"No cached response for {url} (offline mode)")
+        yield _read_chunks(body_file), True
+        return
+
+    with (session or requests).get(
+        url, headers=_conditional_headers(url), stream=True
+    ) as response:
+        if response.status_code == 304:
+            yield _read_chunks(body_file), False
+            return
+        response.raise_for_status()
+        if cache_mode == "off":
+            yield response.iter_content(stream_chunk_size), True
+            return
+        chunks = _tee_to_cache(url, response)
+        yield chunks, True
+        # Finish the cache entry even if the reader stopped early
+        for _ in chunks:
+            pass
+
+
+def fetch_json(
+    url: str, session: Optional[requests.Session] = None, if_changed: bool = False
+):
+    # With if_changed, returns None instead of re-parsing an unmodified response
+    with open_url(url, session) as (chunks, changed):
+        if if_changed and not changed:
+            return None
+        return json.loads(b"".join(chunks))
+
+
+def load_cached_json(url: str):
+    body_file, _ = _cache_files(url)
+    return json.loads(body_file.read_bytes())
+
+
+def get_total_entries(session: Optional[requests.Session] = None):
+    data = fetch_json(paged_api_link.format(1, 0), session)
     print(f"Total entries available: {data['total']}")
     return int(data["total"])
 
 
+def _written_record_path():
+    # Size and mtime of the dataset files the last scrape of each suffix wrote
+    return dataset_path / ".written.json"
+
+
+def _file_stamp(path: Path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def record_written(suffix: str, paths: list[Path], extension: str = "json"):
+    try:
+        record = json.loads(_written_record_path().read_text())
+    except (OSError, ValueError):
+        record = {}
+    record[f"{suffix}.{extension}"] = {
+        path.name: _file_stamp(path) for path in paths if path.exists()
+    }
+    atomic.write_json(_written_record_path(), record)
+
+
+def datasets_intact(suffix: str, extension: str = "json"):
+    # Whether every file the last scrape wrote for `suffix` is still there
+    # unmodified. An unmodified response only skips the write while this holds;
+    # otherwise the cached body is written out again
+    try:
+        record = json.loads(_written_record_path().read_text())
+        files = record[f"{suffix}.{extension}"]
+        return bool(files) and all(
+            _file_stamp(dataset_path / name) == stamp for name, stamp in files.items()
+        )
+    except (OSError, ValueError, KeyError):
+        return False
+
+
 def fetch_full_data(total_entries: Optional[int] = None):
     leaderboards = defaultdict(list)
-    response = requests.get(paged_api_link.format(total_entries or get_total_entries()))
-    response.raise_for_status()
-    data = response.json()
+    url = paged_api_link.format(total_entries or get_total_entries(), 0)
+    data = fetch_json(url, if_changed=True)
+    if data is None:
+        if datasets_intact("full"):
+            print("Leaderboards not modified since the last run")
+            return None, "full"
+        print("Leaderboards not modified, rewriting missing or edited datasets")
+        data = load_cached_json(url)
     for e in data["data"]:
         leaderboards[e["leaderboardType"]].append(e)
 
@@ -35,11 +202,58 @@ def fetch_full_data(total_entries: Optional[int] = None):
     return leaderboards, "full"
 
 
+def page_urls(total: int, page_size: int):
+    return [
+        paged_api_link.format(page_size, page)
+        for page in range(math.ceil(total / page_size))
+    ]
+
+
+def fetch_page(session: requests.Session, url: str):
+    data = fetch_json(url, session, if_changed=True)
+    return None if data is None else data["data"]
+
+
+def fetch_paged_data(
+    total_entries: Optional[int] = None, page_size: int = 1000, max_workers: int = 8
+):
+    session = make_session(max_workers)
+    total = total_entries or get_total_entries(session)
+    urls = page_urls(total, page_size)
+    print(f"Fetching {len(urls)} pages of {page_size} with {max_workers} workers")
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # map() yields in page order, so entries keep the API's ordering
+        pages = list(pool.map(lambda url: fetch_page(session, url), urls))
+    if all(entries is None for entries in pages):
+        if datasets_intact("full"):
+            print("Leaderboards not modified since the last run")
+            return None, "full"
+        print("Leaderboards not modified, rewriting missing or edited datasets")
+
+    leaderboards = defaultdict(list)
+    count = 0
+    for url, entries in zip(urls, pages):
+        if entries is None:
+            entries = load_cached_json(url)["data"]
+        for e in entries:
+            leaderboards[e["leaderboardType"]].append(e)
+        count += len(entries)
+
+    print(f"Found total entries: {count}")
+    return leaderboards, "full"
+
+
 def fetch_n_rank_data(n: int = 100):
-    response = requests.get(ranked_api_link.format(n))
-    response.raise_for_status()
+    url = ranked_api_link.format(n)
+    data = fetch_json(url, if_changed=True)
+    if data is None:
+        if datasets_intact(f"top_{n}"):
+            print("Leaderboards not modified since the last run")
+            return None, f"top_{n}"
+        print("Leaderboards not modified, rewriting missing or edited datasets")
+        data = load_cached_json(url)
 
-    data = response.json()
     leaderboards = defaultdict(list)
     for e in data["data"]:
         leaderboards[e["leaderboardType"]].append(e)
@@ -50,12 +264,424 @@ def fetch_n_rank_data(n: int = 100):
 
 
 def save_leaderboards(leaderboards: defaultdict, suffix: str):
+    written = []
     for lb_type, entries in leaderboards.items():
         print(f"Leaderboard Type: {lb_type}, Entries: {len(entries)}")
-        with open(dataset_path / f"{lb_type}_{suffix}.json", "w") as f:
+        path = dataset_path / f"{lb_type}_{suffix}.json"
+        with open(path, "w") as f:
             json.dump(entries, f)
+        loader.write_columnar(entries, loader.columnar_path(path))
+        written += [path, loader.columnar_path(path)]
+    record_written(suffix, written)
+
+
+_decoder = json.JSONDecoder()
+# What may follow the part of a number decoded so far in a later chunk
+_number_tail = re.compile(r"[0-9.eE+-]*")
+
+
+def iter_json_array(chunks, key: str = "data"):
+    # Walk `{..., "<key>": [item, ...], ...}` from a stream of text chunks and
+    # yield each item as soon as it is complete, so memory stays at one chunk
+    # plus one entry however long the array is
+    chunks = iter(chunks)
+    buf, pos = "", 0
+
+    def more():
+        nonlocal buf, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, got {buf[pos]!r}")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not more():
+                    raise
+                continue
+            # A value that only number characters separate from the buffer
+            # edge may be a cut-off number ("-" + "0.5", "2." + "5", "1e" + "3")
+            if not _number_tail.fullmatch(buf, end) or not more():
+                pos = end
+                return obj
+
+    expect("{")
+    while peek() != "}":
+        name = value()
+        expect(":")
+        if name != key:
+            value()
+        else:
+            expect("[")
+            while peek() != "]":
+                yield value()
+                if peek() == ",":
+                    pos += 1
+            return
+        if peek() == ",":
+            pos += 1
+    raise ValueError(f"Key {key!r} not found in JSON stream")
+
+
+class JsonArrayWriter:
+    # Appends entries to a JSON array on disk; the finished file is identical to
+    # json.dump(entries, f) and only replaces the target once it is complete.
+    # The Feather copy of a JSON leaderboard is built alongside, a batch of
+    # entries at a time (see loader.ColumnarWriter)
+    extension = "json"
+    opening, separator, closing = "[", ", ", "]"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.part = atomic.part_path(path)
+        self.count = 0
+        self.columnar = (
+            loader.ColumnarWriter(loader.columnar_path(path))
+            if self.extension == "json"
+            else None
+        )
+        # Kept open across write() calls; close() or abort() closes it
+        self.file = open(self.part, "w")  # noqa: SIM115
+        self.file.write(self.opening)
+
+    def write(self, entry: dict):
+        if self.count:
+            self.file.write(self.separator)
+        self.file.write(json.dumps(entry))
+        if self.columnar is not None:
+            self.columnar.write(entry)
+        self.count += 1
+
+    def close(self):
+        self.file.write(self.closing)
+        self.file.close()
+        os.replace(self.part, self.path)
+        # Written after the JSON, so the loader sees the copy as up to date
+        if self.columnar is not None:
+            self.columnar.close()
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.part)
+        if self.columnar is not None:
+            self.columnar.abort()
+
+
+class JsonLinesWriter(JsonArrayWriter):
+    # Append-only JSONL, one entry per line
+    extension = "jsonl"
+    opening, separator, closing = "", "\n", "\n"
+
+
+stream_writers = {"json": JsonArrayWriter, "jsonl": JsonLinesWriter}
+
+
+def stream_leaderboards(
+    urls: list[str],
+    suffix: str,
+    fmt: str = "json",
+    session: Optional[requests.Session] = None,
+):
+    # Parse each response as it comes off the socket and hand every entry straight
+    # to a per-leaderboardType writer instead of collecting them in memory
+    writer_cls = stream_writers[fmt]
+    writers = {}
+    count = 0
+
+    def consume(chunks):
+        nonlocal count
+        for e in iter_json_array(codecs.iterdecode(chunks, "utf-8")):
+            lb_type = e["leaderboardType"]
+            if lb_type not in writers:
+                writers[lb_type] = writer_cls(
+                    dataset_path / f"{lb_type}_{suffix}.{writer_cls.extension}"
+                )
+            writers[lb_type].write(e)
+            count += 1
+
+    # Unmodified responses are only replayed from the cache once some other
+    # response has changed; if none did, the datasets are left untouched
+    # unless some of them are missing or were edited
+    unchanged = []
+    modified = False
+    try:
+        for url in urls:
+            with open_url(url, session) as (chunks, changed):
+                if not changed:
+                    unchanged.append(url)
+                    continue
+                for cached_url in unchanged:
+                    consume(_read_chunks(_cache_files(cached_url)[0]))
+                unchanged = []
+                modified = True
+                consume(chunks)
+        if not modified:
+            if datasets_intact(suffix, writer_cls.extension):
+                print("Leaderboards not modified since the last run")
+                return None
+            print("Leaderboards not modified, rewriting missing or edited datasets")
+        for cached_url in unchanged:
+            consume(_read_chunks(_cache_files(cached_url)[0]))
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    for lb_type, writer in writers.items():
+        print(f"Leaderboard Type: {lb_type}, Entries: {writer.count}")
+        writer.close()
+    record_written(
+        suffix,
+        [
+            path
+            for writer in writers.values()
+            for path in (writer.path, loader.columnar_path(writer.path))
+        ],
+        writer_cls.extension,
+    )
+    print(f"Found total entries: {count}")
+    return {lb_type: writer.count for lb_type, writer in writers.items()}
+
+
+def _load_manifest(stage: Path, total: int, page_size: int):
+    manifest_file = stage / "manifest.json"
+    if manifest_file.exists():
+        manifest = json.loads(manifest_file.read_text())
+        age = time.time() - manifest.get("started", 0)
+        if (
+            manifest["total"] == total
+            and manifest["page_size"] == page_size
+            and age <= staging_max_age
+        ):
+            return manifest
+        # The leaderboard changed size or the pages are too old to be mixed
+        # with new ones, so start over
+        print(f"Discarding the staged pages from {age / 3600:.1f} hours ago")
+    if stage.exists():
+        shutil.rmtree(stage)
+    os.makedirs(stage, exist_ok=True)
+    manifest = {
+        "total": total,
+        "page_size": page_size,
+        "started": time.time(),
+        "completed": [],
+    }
+    atomic.write_json(manifest_file, manifest)
+    return manifest
+
+
+def _page_range(page: int, manifest: dict):
+    start = page * manifest["page_size"]
+    return start, min(start + manifest["page_size"], manifest["total"])
+
+
+def _mark_completed(manifest: dict, start: int, end: int):
+    # Completed entry offsets are kept as merged [start, end) ranges
+    merged = []
+    for lo, hi in sorted(manifest["completed"] + [[start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    manifest["completed"] = merged
+
+
+def _is_completed(manifest: dict, start: int, end: int):
+    return any(lo <= start and end <= hi for lo, hi in manifest["completed"])
+
+
+def fetch_resumable_data(
+    total_entries: Optional[int] = None, page_size: int = 1000, max_workers: int = 8
+):
+    # Checkpoint every page under staging_path and only fetch what is missing
+    # from a previous, interrupted run. The datasets are swapped in once all
+    # pages are present
+    session = make_session(max_workers)
+    total = total_entries or get_total_entries(session)
+    stage = staging_path
+    manifest = _load_manifest(stage, total, page_size)
+    urls = page_urls(total, page_size)
+    missing = [
+        page
+        for page in range(len(urls))
+        if not _is_completed(manifest, *_page_range(page, manifest))
+    ]
+    print(
+        f"{len(urls) - len(missing)} of {len(urls)} pages already staged, "
+        f"fetching {len(missing)} with {max_workers} workers"
+    )
+
+    failed = []
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_json, urls[page], session): page for page in missing
+        }
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                entries = future.result()["data"]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"Page {page} failed: {e}")
+                failed.append(page)
+                continue
+            atomic.write_json(stage / f"page_{page:05d}.json", entries)
+            _mark_completed(manifest, *_page_range(page, manifest))
+            atomic.write_json(stage / "manifest.json", manifest)
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(urls)} pages failed; run again to resume"
+        )
+    return finalize_staged_data(stage, len(urls), "full", total)
+
+
+def finalize_staged_data(
+    stage: Path, pages: int, suffix: str, total: Optional[int] = None
+):
+    # Rebuild each leaderboard from the staged pages in order, then move the
+    # finished files over datasets/ so a half-written file is never visible.
+    # Pages whose entries don't add up to `total` or repeat a project within a
+    # leaderboard (the ranking moved between fetches) are discarded instead
+    writers = {}
+    seen = defaultdict(set)
+    problem = None
+    for page in range(pages):
+        for e in json.loads((stage / f"page_{page:05d}.json").read_text()):
+            lb_type = e["leaderboardType"]
+            # People and organizations have no slug, but all entries have ids
+            keys = [("id", e["id"])] + ([("slug", e["slug"])] if e["slug"] else [])
+            for key in keys:
+                if problem is None and key in seen[lb_type]:
+                    problem = f"{lb_type} lists the {key[0]} {key[1]!r} twice"
+                seen[lb_type].add(key)
+            if lb_type not in writers:
+                writers[lb_type] = JsonArrayWriter(stage / f"{lb_type}_{suffix}.json")
+            writers[lb_type].write(e)
+    count = sum(writer.count for writer in writers.values())
+    if problem is None and total is not None and count != total:
+        problem = f"{count} entries staged, {total} expected"
+    if problem is not None:
+        for writer in writers.values():
+            writer.abort()
+        shutil.rmtree(stage)
+        raise RuntimeError(
+            f"Staged pages are inconsistent ({problem}); discarded them, run again"
+        )
+    for writer in writers.values():
+        writer.close()
+
+    for lb_type, writer in writers.items():
+        print(f"Leaderboard Type: {lb_type}, Entries: {writer.count}")
+        binary = loader.columnar_path(writer.path)
+        os.replace(writer.path, dataset_path / writer.path.name)
+        os.replace(binary, dataset_path / binary.name)
+    record_written(
+        suffix,
+        [
+            dataset_path / name
+            for writer in writers.values()
+            for name in (writer.path.name, loader.columnar_path(writer.path).name)
+        ],
+    )
+    shutil.rmtree(stage)
+    print(f"Found total entries: {sum(w.count for w in writers.values())}")
+    return {lb_type: writer.count for lb_type, writer in writers.items()}
 
 
 if __name__ == "__main__":
-    leaderboards, suffix = fetch_full_data()
-    save_leaderboards(leaderboards, suffix)
+    parser = argparse.ArgumentParser(description="Fetch LFX leaderboard datasets")
+    parser.add_argument(
+        "--mode",
+        choices=["full", "paged", "resumable", "top"],
+        default="full",
+        help="single full request, concurrent pages, checkpointed pages, "
+        "or top-N ranks",
+    )
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--top", type=int, default=100, help="ranks for --mode top")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse responses incrementally and write entries as they arrive",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(stream_writers),
+        default="json",
+        help="output format for --stream",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay responses from the HTTP cache without network access",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always download everything and leave the HTTP cache untouched",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=cache_path)
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="record the refreshed full leaderboards in the dated snapshot store",
+    )
+    args = parser.parse_args()
+    cache_path = args.cache_dir
+    if args.offline:
+        cache_mode = "offline"
+    elif args.no_cache:
+        cache_mode = "off"
+
+    if args.mode == "resumable":
+        fetch_resumable_data(page_size=args.page_size, max_workers=args.workers)
+    elif args.stream:
+        # Pages are streamed one after another to keep memory flat
+        if args.mode == "top":
+            urls, suffix = [ranked_api_link.format(args.top)], f"top_{args.top}"
+        elif args.mode == "paged":
+            urls, suffix = page_urls(get_total_entries(), args.page_size), "full"
+        else:
+            urls, suffix = [paged_api_link.format(get_total_entries(), 0)], "full"
+        stream_leaderboards(urls, suffix, args.format)
+    else:
+        if args.mode == "paged":
+            leaderboards, suffix = fetch_paged_data(
+                page_size=args.page_size, max_workers=args.workers
+            )
+        elif args.mode == "top":
+            leaderboards, suffix = fetch_n_rank_data(args.top)
+        else:
+            leaderboards, suffix = fetch_full_data()
+        if leaderboards is not None:
+            save_leaderboards(leaderboards, suffix)
+
+    if args.snapshot and args.mode != "top":
+        # Record the files this run wrote, in the format it wrote them
+        extension = args.format if args.stream and args.mode != "resumable" else "json"
+        snapshots.record_snapshot(
+            snapshots.read_datasets(dataset_path, extension=extension)
+        )
@@ -0,0 +1,201 @@
+import argparse
+import datetime
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import atomic
+
+snapshot_path = Path(__file__).parent / "snapshots"
+dataset_path = Path(__file__).parent / "datasets"
+# Every Nth version of a leaderboard is stored in full so materializing a date
+# never has to replay more than N - 1 deltas
+keyframe_interval = 30
+
+
+def entry_key(entry: dict):
+    # Project leaderboards are keyed by slug; people/organization leaderboards
+    # have empty slugs, so fall back to the entry id
+    return entry.get("slug") or entry["id"]
+
+
+def _load_index(lb_type: str, root: Path):
+    index_file = root / lb_type / "index.json"
+    if not index_file.exists():
+        return []
+    return json.loads(index_file.read_text())
+
+
+def _diff(previous: dict, current: dict):
+    # Changed entries only carry the fields that differ (usually rank/value);
+    # entries whose set of fields changed are stored whole under "added"
+    delta = {"added": [], "changed": {}, "removed": []}
+    for key, entry in current.items():
+        before = previous.get(key)
+        if before is None or before.keys() != entry.keys():
+            delta["added"].append(entry)
+        elif before != entry:
+            delta["changed"][key] = {
+                field: value for field, value in entry.items() if before[field] != value
+            }
+    delta["removed"] = [key for key in previous if key not in current]
+    return delta
+
+
+def _apply_delta(state: dict, delta: dict):
+    for key in delta["removed"]:
+        del state[key]
+    for entry in delta["added"]:
+        state[entry_key(entry)] = entry
+    for key, fields in delta["changed"].items():
+        state[key] = {**state[key], **fields}
+
+
+def _materialize_versions(lb_type: str, versions: list, root: Path):
+    # Replay from the last keyframe in `versions` up to its final version
+    start = max(i for i, v in enumerate(versions) if v["kind"] == "full")
+    state = {}
+    for version in versions[start:]:
+        data = json.loads((root / lb_type / version["file"]).read_text())
+        if version["kind"] == "full":
+            state = {entry_key(e): e for e in data}
+        else:
+            _apply_delta(state, data)
+    return state
+
+
+def list_snapshots(lb_type: Optional[str] = None, root: Path = snapshot_path):
+    if lb_type is not None:
+        return [v["date"] for v in _load_index(lb_type, root)]
+    if not root.exists():
+        return {}
+    return {
+        p.name: list_snapshots(p.name, root)
+        for p in sorted(root.iterdir())
+        if p.is_dir()
+    }
+
+
+def record_snapshot(
+    leaderboards: dict,
+    date: Optional[str] = None,
+    root: Path = snapshot_path,
+):
+    # Store today's leaderboards as a new dated version. Only the entries added,
+    # removed or changed since the previous version are written, except for
+    # periodic full keyframes
+    date = date or datetime.date.today().isoformat()
+    for lb_type, entries in leaderboards.items():
+        os.makedirs(root / lb_type, exist_ok=True)
+        index = _load_index(lb_type, root)
+        if index and index[-1]["date"] == date:
+            # Re-recording the latest date replaces that version
+            os.remove(root / lb_type / index.pop()["file"])
+        if index and index[-1]["date"] > date:
+            raise ValueError(
+                f"Cannot record {lb_type} at {date}: "
+                f"a newer snapshot ({index[-1]['date']}) exists"
+            )
+
+        current = {entry_key(e): e for e in entries}
+        since_keyframe = next(
+            (i for i, v in enumerate(reversed(index)) if v["kind"] == "full"), None
+        )
+        if since_keyframe is None or since_keyframe + 1 >= keyframe_interval:
+            version = {"date": date, "kind": "full", "file": f"{date}.full.json"}
+            atomic.write_json(root / lb_type / version["file"], entries)
+            print(f"Snapshot {lb_type} @ {date}: full, {len(entries)} entries")
+        else:
+            delta = _diff(_materialize_versions(lb_type, index, root), current)
+            if not any(delta.values()):
+                print(f"Snapshot {lb_type} @ {date}: unchanged, skipped")
+                atomic.write_json(root / lb_type / "index.json", index)
+                continue
+            version = {"date": date, "kind": "delta", "file": f"{date}.delta.json"}
+            atomic.write_json(root / lb_type / version["file"], delta)
+            print(
+                f"Snapshot {lb_type} @ {date}: +{len(delta['added'])} "
+                f"~{len(delta['changed'])} -{len(delta['removed'])}"
+            )
+
+        index.append(version)
+        atomic.write_json(root / lb_type / "index.json", index)
+
+
+def materialize(
+    date: str, lb_types: Optional[list[str]] = None, root: Path = snapshot_path
+):
+    # Rebuild every leaderboard as it was on `date` (the latest version on or
+    # before it), ordered by rank like the scraped files
+    leaderboards = {}
+    for lb_type in lb_types or list_snapshots(root=root):
+        versions = [v for v in _load_index(lb_type, root) if v["date"] <= date]
+        if not versions:
+            continue
+        state = _materialize_versions(lb_type, versions, root)
+        leaderboards[lb_type] = sorted(state.values(), key=lambda e: e["rank"])
+    return leaderboards
+
+
+def materialize_frames(
+    date: str, lb_types: Optional[list[str]] = None, root: Path = snapshot_path
+):
+    # Same as materialize() but shaped like the `dfs` dict in analysis.py
+    import pandas as pd
+
+    return {
+        lb_type: pd.DataFrame(entries)
+        for lb_type, entries in materialize(date, lb_types, root).items()
+    }
+
+
+def read_datasets(
+    path: Path = dataset_path, suffix: str = "full", extension: str = "json"
+):
+    # JSON arrays, or one entry per line with extension="jsonl"
+    leaderboards = {}
+    for file in sorted(path.glob(f"*_{suffix}.{extension}")):
+        text = file.read_text()
+        leaderboards[file.name.removesuffix(f"_{suffix}.{extension}")] = (
+            [json.loads(line) for line in text.splitlines() if line]
+            if extension == "jsonl"
+            else json.loads(text)
+        )
+    return leaderboards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dated leaderboard snapshots")
+    parser.add_argument("--root", type=Path, default=snapshot_path)
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="snapshot the current datasets/")
+    record.add_argument("--date", help="snapshot date (YYYY-MM-DD), default today")
+    record.add_argument("--datasets", type=Path, default=dataset_path)
+    record.add_argument(
+        "--format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="format of the leaderboard files (jsonl: scraper.py --format jsonl)",
+    )
+    commands.add_parser("list", help="list recorded dates per leaderboard")
+    restore = commands.add_parser(
+        "materialize", help="write the leaderboards as of a date"
+    )
+    restore.add_argument("date")
+    restore.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_snapshot(
+            read_datasets(args.datasets, extension=args.format), args.date, args.root
+        )
+    elif args.command == "list":
+        for lb_type, dates in list_snapshots(root=args.root).items():
+            print(f"{lb_type}: {', '.join(dates)}")
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        for lb_type, entries in materialize(args.date, root=args.root).items():
+            print(f"Leaderboard Type: {lb_type}, Entries: {len(entries)}")
+            with open(args.out / f"{lb_type}_full.json", "w") as f:
+                json.dump(entries, f)
@@ -0,0 +1,105 @@
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import loader
+
+
+# The pandas conversion of a loaded frame that loader.compact_frame() replaced
+def reference_compact(df, lb_type):
+    schema = loader.leaderboard_schema(lb_type)
+    columns = {}
+    for name, column in df.items():
+        kind = schema.get(name)
+        if kind == "int":
+            if column.dtype.kind == "i" and column.between(-(2**31), 2**31 - 1).all():
+                column = column.astype("int32")
+        elif kind == "float":
+            column = column.astype("float64")
+        elif kind == "string":
+            column = column.astype(pd.ArrowDtype(pa.string()))
+        elif kind == "category":
+            column = column.astype("category")
+        elif kind == "collections":
+            shared = {}
+            column = pd.Series(
+                [
+                    shared.setdefault(slugs, slugs)
+                    for slugs in (tuple(map(sys.intern, v)) for v in column)
+                ],
+                index=column.index,
+                dtype=object,
+            )
+        elif kind == "bool":
+            column = column.astype("bool")
+        columns[name] = column
+    return pd.DataFrame(columns, index=df.index)
+
+
+def assert_shared(column):
+    # One tuple per distinct list and one string per distinct slug
+    assert all(isinstance(slugs, tuple) for slugs in column)
+    assert len({id(slugs) for slugs in column}) == len(set(column))
+    slugs = [slug for value in column for slug in value]
+    assert len({id(slug) for slug in slugs}) == len(set(slugs))
+
+
+def test_edge_cases():
+    entries = [
+        {
+            "rank": 1,
+            "slug": "b",
+            "leaderboardType": "z",
+            "value": 2**40,
+            "collectionsSlugs": ["x", "y"],
+            "isLF": True,
+        },
+        {
+            "rank": 2,
+            "slug": "a",
+            "leaderboardType": "y",
+            "value": 3,
+            "collectionsSlugs": [],
+            "isLF": False,
+        },
+        {
+            "rank": 3,
+            "slug": "c",
+            "leaderboardType": "z",
+            "value": 1,
+            "collectionsSlugs": ["x", "y"],
+            "isLF": True,
+        },
+        {
+            "rank": 4,
+            "slug": "d",
+            "leaderboardType": "y",
+            "value": 0,
+            "collectionsSlugs": ["x,y"],
+            "isLF": False,
+        },
+    ]
+    frame = loader.compact_frame(loader._arrow_table(entries), "commit-activity")
+    pd.testing.assert_frame_equal(
+        frame, reference_compact(pd.DataFrame(entries), "commit-activity")
+    )
+    assert frame["rank"].dtype == "int32" and frame["value"].dtype == "int64"
+    assert list(frame["leaderboardType"].cat.categories) == ["y", "z"]
+    assert_shared(frame["collectionsSlugs"])
+
+
+@pytest.mark.parametrize(
+    "json_path",
+    sorted(loader.dataset_path.glob("*_full.json")),
+    ids=lambda path: path.stem,
+)
+def test_datasets(json_path):
+    lb_type = json_path.stem.rsplit("_", 1)[0]
+    table = loader._arrow_table(loader.decode_json(json_path.read_bytes()))
+    frame = loader.compact_frame(table, lb_type)
+    pd.testing.assert_frame_equal(
+        frame, reference_compact(loader.read_json(json_path), lb_type)
+    )
+    assert_shared(frame["collectionsSlugs"])
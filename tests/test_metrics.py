@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import loader
+import metrics
+
+
+# The row-wise definitions the burnout and churn sections used before
+# metrics.momentum() and metrics.churn_ratio() replaced them
+def reference_momentum(df):
+    return df.apply(
+        lambda row: (
+            (row["commits"] - row["prev_commits"]) / row["prev_commits"]
+            if row["prev_commits"] > 0
+            else 0
+        ),
+        axis=1,
+    )
+
+
+def reference_churn_ratio(df):
+    return df.apply(
+        lambda row: (
+            row["commits"] / row["net_line_change"]
+            if row["net_line_change"] > 0
+            else row["commits"]
+        ),
+        axis=1,
+    )
+
+
+edge_cases = pd.DataFrame(
+    {
+        "commits": [0.0, 5.0, 10.0, 7.0, 3.0, math.nan, 8.0],
+        "prev_commits": [0.0, 0.0, 4.0, 14.0, math.nan, 2.0, -1.0],
+        "net_line_change": [0.0, 0.0, 3.0, 2.0, math.nan, 6.0, 0.0],
+    }
+)
+
+
+def test_momentum_edge_cases():
+    pd.testing.assert_series_equal(
+        metrics.momentum(edge_cases["commits"], edge_cases["prev_commits"]),
+        reference_momentum(edge_cases),
+        check_exact=True,
+    )
+
+
+def test_churn_ratio_edge_cases():
+    pd.testing.assert_series_equal(
+        metrics.churn_ratio(edge_cases["commits"], edge_cases["net_line_change"]),
+        reference_churn_ratio(edge_cases),
+        check_exact=True,
+    )
+
+
+def test_integer_columns():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "commits": rng.integers(0, 1000, 1000),
+            "prev_commits": rng.integers(0, 3, 1000) * rng.integers(0, 1000, 1000),
+            "net_line_change": rng.integers(0, 2, 1000) * rng.integers(0, 1000, 1000),
+        }
+    ).astype("int32")
+    pd.testing.assert_series_equal(
+        metrics.momentum(df["commits"], df["prev_commits"]),
+        reference_momentum(df),
+        check_exact=True,
+    )
+    pd.testing.assert_series_equal(
+        metrics.churn_ratio(df["commits"], df["net_line_change"]),
+        reference_churn_ratio(df),
+        check_exact=True,
+        check_dtype=False,
+    )
+
+
+@pytest.fixture(params=[True, False], ids=["compact", "inferred"])
+def projects(request, monkeypatch):
+    # The real datasets, with and without the compact frame schema
+    monkeypatch.setattr(loader, "compact_frames", request.param)
+    monkeypatch.setattr(metrics, "cache_enabled", False)
+    metrics.clear_cache()
+    yield loader.LazyProjectTable(loader.LazyDatasets(loader.dataset_path))
+    metrics.clear_cache()
+
+
+def test_burnout_momentum_matches_reference(projects):
+    df = metrics.burnout(projects)
+    assert (df["prev_commits"] == 0).any()
+    pd.testing.assert_series_equal(
+        df["momentum"], reference_momentum(df), check_exact=True, check_names=False
+    )
+
+
+def test_churn_ratio_matches_reference(projects):
+    df = metrics.churn(projects)
+    pd.testing.assert_series_equal(
+        df["churn_ratio_proxy"],
+        reference_churn_ratio(df),
+        check_exact=True,
+        check_names=False,
+    )
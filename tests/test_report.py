@@ -0,0 +1,58 @@
+import json
+import shutil
+
+import pytest
+
+import loader
+import metrics
+import report
+
+
+@pytest.fixture
+def checkout(tmp_path, monkeypatch):
+    # The committed report and shards as a fresh checkout has them: the state
+    # file is not committed
+    monkeypatch.setattr(metrics, "cache_enabled", False)
+    shutil.copy(report.report_path, tmp_path / report.report_path.name)
+    shutil.copytree(
+        report.shard_path(report.report_path), tmp_path / report.report_path.stem
+    )
+    return tmp_path / report.report_path.name
+
+
+def export(path, dataset_path, names=None, force=False):
+    dfs = loader.LazyDatasets(dataset_path)
+    return report.update_report(
+        path, dfs, loader.LazyProjectTable(dfs), names, force, max_workers=1
+    )
+
+
+def shard_keys(path):
+    manifest = json.loads((report.shard_path(path) / "manifest.json").read_text())
+    return set(manifest["keys"])
+
+
+def test_sections_without_state(checkout, capsys):
+    keys = set(json.loads(checkout.read_text()))
+    export(checkout, loader.dataset_path, ["triage", "churn"], force=True)
+    assert set(json.loads(checkout.read_text())) == keys
+    assert shard_keys(checkout) == keys
+    assert "also recomputing the sections left out" in capsys.readouterr().out
+
+    # With the state written, only the named sections are recomputed
+    export(checkout, loader.dataset_path, ["triage"], force=True)
+    assert set(json.loads(checkout.read_text())) == keys
+    assert "Recomputed report sections: triage\n" in capsys.readouterr().out
+
+
+def test_sections_without_state_or_leaderboards(checkout, tmp_path):
+    datasets = tmp_path / "datasets"
+    datasets.mkdir()
+    for file in loader.dataset_path.glob("*_full.json"):
+        if not file.name.startswith("small-teams-massive-output"):
+            shutil.copy(file, datasets)
+    before = checkout.read_bytes()
+    with pytest.raises(RuntimeError, match="bus_factor"):
+        export(checkout, datasets, ["triage"])
+    assert checkout.read_bytes() == before
+    assert shard_keys(checkout) == set(json.loads(before))
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from pyarrow import feather
+
+import loader
+import scraper
+
+
+class LeaderboardHandler(BaseHTTPRequestHandler):
+    # Stand-in for the LFX leaderboard API: pages of `entries`, with an ETag
+    # per response and 304 for a matching If-None-Match. The api fixture
+    # subclasses it with the entries and a list that collects the statuses
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        size, page = int(query["pageSize"][0]), int(query["page"][0])
+        data = self.entries[page * size : (page + 1) * size]
+        body = json.dumps({"total": len(self.entries), "data": data}).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        status = 304 if self.headers.get("If-None-Match") == etag else 200
+        self.statuses.append(status)
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        if status == 200:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    # The first entries of every leaderboard, interleaved so that pages mix
+    # leaderboard types
+    boards = [
+        json.loads(file.read_text())[:12]
+        for file in sorted(loader.dataset_path.glob("*_full.json"))
+    ]
+    handler = type(
+        "Handler",
+        (LeaderboardHandler,),
+        {"entries": [e for row in zip(*boards) for e in row], "statuses": []},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}/api"
+    monkeypatch.setattr(
+        scraper, "paged_api_link", base + "/leaderboard?page={1}&pageSize={0}"
+    )
+    monkeypatch.setattr(scraper, "cache_path", tmp_path / "cache")
+    monkeypatch.setattr(scraper, "cache_mode", "refresh")
+    use_datasets(monkeypatch, tmp_path / "datasets")
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def use_datasets(monkeypatch, path):
+    path.mkdir(exist_ok=True)
+    monkeypatch.setattr(scraper, "dataset_path", path)
+    monkeypatch.setattr(scraper, "staging_path", path / ".staging")
+
+
+def dataset_files(path):
+    return {
+        file.name: file.read_bytes()
+        for file in sorted(path.iterdir())
+        if file.suffix in (".json", ".jsonl") and not file.name.startswith(".")
+    }
+
+
+def test_paged_matches_single_request(api):
+    full, _ = scraper.fetch_full_data()
+    paged, _ = scraper.fetch_paged_data(page_size=7, max_workers=4)
+    assert list(paged) == list(full)
+    assert paged == full
+    assert sum(map(len, full.values())) == len(api.entries)
+
+
+def test_save_paths_match(api, tmp_path, monkeypatch):
+    total = len(api.entries)
+    urls = scraper.page_urls(total, 7)
+    leaderboards, _ = scraper.fetch_full_data(total)
+    scraper.save_leaderboards(leaderboards, "full")
+    expected = dataset_files(tmp_path / "datasets")
+    assert len(expected) == len(leaderboards)
+
+    use_datasets(monkeypatch, tmp_path / "streamed")
+    scraper.stream_leaderboards(urls, "full")
+    assert dataset_files(tmp_path / "streamed") == expected
+    for name in expected:
+        binary = loader.columnar_path(tmp_path / "streamed" / name)
+        assert feather.read_table(binary).equals(
+            feather.read_table(loader.columnar_path(tmp_path / "datasets" / name))
+        )
+
+    use_datasets(monkeypatch, tmp_path / "lines")
+    scraper.stream_leaderboards(urls, "full", "jsonl")
+    for name, raw in dataset_files(tmp_path / "lines").items():
+        lines = raw.decode().splitlines()
+        assert [json.loads(line) for line in lines] == json.loads(
+            expected[name.removesuffix("l")]
+        )
+
+    use_datasets(monkeypatch, tmp_path / "resumable")
+    scraper.fetch_resumable_data(page_size=7, max_workers=4)
+    assert dataset_files(tmp_path / "resumable") == expected
+    assert not (tmp_path / "resumable" / ".staging").exists()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_iter_json_array(chunk_size):
+    items = [{"a": [1, 2.5, None]}, 123456, -0.5e-3, 2.5e10, "x, ]}", [], {}, True]
+    text = json.dumps({"total": 7, "skip": {"data": [0]}, "data": items}, indent=1)
+    chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+    assert list(scraper.iter_json_array(chunks)) == items
+    with pytest.raises(ValueError):
+        list(scraper.iter_json_array(chunks, "missing"))
+
+
+def test_not_modified(api, tmp_path):
+    datasets = tmp_path / "datasets"
+    leaderboards, _ = scraper.fetch_full_data()
+    scraper.save_leaderboards(leaderboards, "full")
+    files = dataset_files(datasets)
+
+    api.statuses.clear()
+    assert scraper.fetch_full_data(len(api.entries)) == (None, "full")
+    assert api.statuses == [304]
+
+    # A missing dataset is rewritten from the cached response
+    (datasets / next(iter(files))).unlink()
+    api.statuses.clear()
+    replayed, _ = scraper.fetch_full_data(len(api.entries))
+    assert api.statuses == [304]
+    assert replayed == leaderboards
+    scraper.save_leaderboards(replayed, "full")
+    assert dataset_files(datasets) == files
+
+    urls = scraper.page_urls(len(api.entries), 7)
+    scraper.stream_leaderboards(urls, "full")
+    api.statuses.clear()
+    assert scraper.stream_leaderboards(urls, "full") is None
+    assert set(api.statuses) == {304}
+    assert dataset_files(datasets) == files